@@ -129,6 +129,50 @@ export const hybridSearch = action({
   },
 });
 
+/**
+ * Hybrid search followed by re-ranking, served from Modal's semantic
+ * query cache when a similar question was recently asked for the course.
+ */
+export const searchCourse = action({
+  args: {
+    query: v.string(),
+    courseId: v.id("courses"),
+    topK: v.optional(v.number()),
+    topN: v.optional(v.number()),
+  },
+  handler: async (ctx, args) => {
+    const userId = await getAuthUserId(ctx);
+    if (!userId) throw new Error("Unauthorized");
+
+    try {
+      const response = await fetch(`${MODAL_API_URL}/search`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          query: args.query,
+          course_id: args.courseId,
+          user_id: userId,
+          top_k: args.topK || 50,
+          top_n: args.topN || 5,
+        }),
+      });
+
+      if (!response.ok) {
+        const error = await response.text();
+        throw new Error(`Modal API error: ${error}`);
+      }
+
+      const results = await response.json();
+      return results;
+    } catch (error) {
+      console.error("Error searching course:", error);
+      throw error;
+    }
+  },
+});
+
 /**
  * Re-rank search results using Modal service.
  */
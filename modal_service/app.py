@@ -5,10 +5,22 @@ Agentic RAG pipeline with Hybrid Search and Re-ranking
 
 import modal
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import List, Dict, Any, Optional, Sequence, Tuple, TypedDict
 from pydantic import BaseModel
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 # Modal app setup
 app = modal.App("studylens-ai")
@@ -16,12 +28,30 @@ app = modal.App("studylens-ai")
 # FastAPI app for HTTP endpoints
 web_app = FastAPI()
 
+# Tokenizer, NLTK and BM25 files are baked into the image at build time
+TIKTOKEN_CACHE_DIR = "/root/.cache/tiktoken"
+NLTK_DATA_DIR = "/root/nltk_data"
+DEFAULT_BM25_PARAMS_PATH = "/root/bm25_params.json"
+
+
+def _download_model_assets() -> None:
+    """Image build step, so containers never download these on a request path."""
+    import nltk
+    import tiktoken
+    from pinecone_text.sparse import BM25Encoder
+
+    for resource in ("punkt", "punkt_tab", "stopwords"):
+        nltk.download(resource, download_dir=NLTK_DATA_DIR)
+    tiktoken.encoding_for_model("gpt-4")
+    BM25Encoder.default().dump(DEFAULT_BM25_PARAMS_PATH)
+
+
 # Image with all dependencies
 image = (
     modal.Image.debian_slim(python_version="3.11")
     .pip_install(
         "openai>=1.0.0",
-        "pinecone-client>=3.0.0",
+        "pinecone>=3.0.0",
         "pinecone-text[splade]>=0.1.0",
         "cohere>=5.0.0",
         "langchain>=0.3.0",
@@ -38,12 +68,53 @@ image = (
         "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", ""),
         "PINECONE_API_KEY": os.environ.get("PINECONE_API_KEY", ""),
         "COHERE_API_KEY": os.environ.get("COHERE_API_KEY", ""),
+        "TIKTOKEN_CACHE_DIR": TIKTOKEN_CACHE_DIR,
+        "NLTK_DATA": NLTK_DATA_DIR,
     })
+    .run_function(_download_model_assets)
+    # Only set for running containers, not for the build step above
+    .env({"STUDYLENS_PRELOAD": "1"})
+    # Helper modules that sit next to app.py
+    .add_local_python_source("pdf_extraction")
 )
 
+# Heavy libraries are imported once per container (and captured by memory
+# snapshots) rather than inside every function call
+with image.imports():
+    import cohere
+    import numpy as np
+    import openai
+    import requests
+    import tiktoken
+    from langchain_core.runnables import RunnableConfig
+    from langchain_openai import ChatOpenAI
+    from langgraph.graph import StateGraph, END
+    from pinecone import Pinecone
+    from pinecone_text.sparse import BM25Encoder
+
+# Startup-optimized deployment, configured when running `modal deploy`:
+#   STUDYLENS_MEMORY_SNAPSHOT=0   disable memory snapshots
+#   STUDYLENS_MIN_CONTAINERS=N    keep N warm containers per interactive function
+#                                 (at most 1 for the single web container)
+#   STUDYLENS_SCALEDOWN_WINDOW=S  keep idle containers for S seconds
+STARTUP_OPTIONS: Dict[str, Any] = {
+    "enable_memory_snapshot": os.environ.get("STUDYLENS_MEMORY_SNAPSHOT", "1") == "1",
+}
+INTERACTIVE_WARM_POOL: Dict[str, Any] = {}
+if os.environ.get("STUDYLENS_MIN_CONTAINERS"):
+    INTERACTIVE_WARM_POOL["min_containers"] = int(os.environ["STUDYLENS_MIN_CONTAINERS"])
+if os.environ.get("STUDYLENS_SCALEDOWN_WINDOW"):
+    INTERACTIVE_WARM_POOL["scaledown_window"] = int(os.environ["STUDYLENS_SCALEDOWN_WINDOW"])
+# The web endpoint is pinned to one container, and Modal rejects min_containers > max_containers
+WEB_WARM_POOL: Dict[str, Any] = dict(INTERACTIVE_WARM_POOL)
+if "min_containers" in WEB_WARM_POOL:
+    WEB_WARM_POOL["min_containers"] = min(WEB_WARM_POOL["min_containers"], 1)
+
 # Shared volume for temporary file storage (optional)
 # volume = modal.Volume.from_name("studylens-temp", create_if_missing=True)
 
+logger = logging.getLogger("studylens")
+
 # Secrets
 secrets = [
     modal.Secret.from_name("openai-secret"),
@@ -86,79 +157,385 @@ class StudyPlanResponse(BaseModel):
 
 
 # ============================================================================
-# PDF Processing & Embedding Generation
+# Tracing & Metrics
 # ============================================================================
 
-@app.function(
-    image=image,
-    secrets=secrets,
-    timeout=600,
-    memory=2048,
+# Always attach Server-Timing headers; otherwise only when the client sends X-StudyLens-Timing
+TIMING_HEADERS_ENABLED = os.environ.get("STUDYLENS_TIMING_HEADERS", "") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter in Prometheus text exposition format."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in Prometheus text exposition format."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[tuple, List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for key, (bucket_counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (repr(bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "studylens_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]
 )
-def process_pdf_and_generate_embeddings(
-    file_url: str,
-    file_id: str,
-    course_id: str,
-    user_id: str,
-    file_name: str,
-) -> Dict[str, Any]:
+REQUEST_SECONDS = metrics.histogram(
+    "studylens_request_duration_seconds", "End-to-end HTTP request latency.", ["endpoint"]
+)
+REQUESTS = metrics.counter(
+    "studylens_requests_total", "HTTP requests by endpoint and status code.", ["endpoint", "status"]
+)
+TOKENS = metrics.counter("studylens_tokens_total", "Tokens processed, by kind.", ["kind"])
+VECTORS = metrics.counter("studylens_vectors_total", "Vectors processed, by operation.", ["op"])
+CACHE_LOOKUPS = metrics.counter(
+    "studylens_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"]
+)
+CACHE_EVICTIONS = metrics.counter(
+    "studylens_cache_evictions_total", "Cache entries dropped by cache and reason.", ["cache", "reason"]
+)
+ADMISSION_REJECTED = metrics.counter(
+    "studylens_admission_rejected_total", "Requests rejected by the scheduler (429 or 400).", ["priority"]
+)
+
+# Counters that Modal functions can increment through Trace.count()
+TRACE_COUNTERS = {"tokens": TOKENS, "vectors": VECTORS, "cache_lookups": CACHE_LOOKUPS}
+
+
+class Trace:
     """
-    Process PDF from URL, chunk it, and generate hybrid embeddings (dense + sparse).
-    Returns embeddings ready for Pinecone upsert.
+    Stage spans and counter increments for a single request.
+    Serializable so it can cross from a Modal function back to the web container.
     """
-    import requests
-    from pypdf import PdfReader
-    from io import BytesIO
-    import openai
-    from pinecone_text.sparse import BM25Encoder
-    import tiktoken
-    import numpy as np
 
-    # Initialize clients
-    openai_client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    def __init__(self, trace_id: Optional[str] = None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.started_at = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.counts: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append({
+                "stage": stage,
+                "start": start - self.started_at,
+                "duration": time.perf_counter() - start,
+            })
+
+    def count(self, metric: str, value: float = 1.0, **labels: str) -> None:
+        self.counts.append({"metric": metric, "value": value, "labels": labels})
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"spans": self.spans, "counts": self.counts}
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        self.spans.extend(other.get("spans", []))
+        self.counts.extend(other.get("counts", []))
+
+    def record(self) -> None:
+        """Fold spans and counts into this container's metrics registry."""
+        for span in self.spans:
+            STAGE_SECONDS.observe(span["duration"], stage=span["stage"])
+        for item in self.counts:
+            TRACE_COUNTERS[item["metric"]].inc(item["value"], **item["labels"])
+
+    def server_timing(self) -> str:
+        """Render a Server-Timing header, summing repeated stages."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span["stage"]] = totals.get(span["stage"], 0.0) + span["duration"]
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("studylens_trace", default=None)
+
+
+def current_trace() -> Trace:
+    trace = _current_trace.get()
+    if trace is None:
+        trace = Trace()
+        _current_trace.set(trace)
+    return trace
+
+
+def traced(func):
+    """
+    Run a Modal function under a fresh Trace. When the caller passes a
+    `trace_id` keyword argument, the trace is returned with the result as
+    {"result": ..., "trace": ...} so the web container can merge it without
+    an extra round trip; other callers get the plain result.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+        if kwargs.get("trace_id"):
+            return {"result": result, "trace": trace.to_dict()}
+        return result
+    return wrapper
+
+
+# ============================================================================
+# Shared Clients & Per-Container State
+# ============================================================================
+
+@functools.lru_cache(maxsize=None)
+def _openai_client():
+    return openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+
+@functools.lru_cache(maxsize=None)
+def _cohere_client():
+    return cohere.Client(api_key=os.environ["COHERE_API_KEY"])
+
+
+@functools.lru_cache(maxsize=None)
+def _chat_llm():
+    return ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.7,
+        api_key=os.environ["OPENAI_API_KEY"],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _pinecone_index(index_name: str):
+    """
+    Open a Pinecone index. Setting PINECONE_INDEX_HOST skips the control-plane
+    lookup of the index host (and lets benchmarks point at a local stand-in).
+    """
+    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    host = os.environ.get("PINECONE_INDEX_HOST")
+    if host:
+        return pc.Index(index_name, host=host)
+    return pc.Index(index_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _bm25_query_encoder():
+    """
+    BM25 encoder for queries. Uses params fitted on the corpus from
+    BM25_PARAMS_PATH when set, then the MS MARCO params baked into the
+    image, then downloads those defaults.
+    """
+    params_path = os.environ.get("BM25_PARAMS_PATH")
+    if not params_path and os.path.exists(DEFAULT_BM25_PARAMS_PATH):
+        params_path = DEFAULT_BM25_PARAMS_PATH
+    if params_path:
+        return BM25Encoder().load(params_path)
+    return BM25Encoder.default()
+
+
+@functools.lru_cache(maxsize=None)
+def _tiktoken_encoding():
+    return tiktoken.encoding_for_model("gpt-4")
+
+
+def _preload() -> None:
+    """
+    Build per-container state ahead of the first request. Runs at import in
+    Modal containers, so memory snapshots capture it. Clients are left lazy
+    because they need secrets and open connections.
+    """
+    _tiktoken_encoding()
+    _bm25_query_encoder()
+    _study_plan_graph()
+
+
+# ============================================================================
+# PDF Processing & Embedding Generation
+# ============================================================================
+
+# Cores for PDF text extraction; pypdf is pure Python, so pages are extracted
+# by a process pool sized to this
+PDF_EXTRACTION_CPU = 4.0
+
+# Tokens per embeddings request. The web endpoint admits each batch against the
+# shared embedding token quota before sending it.
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "20000"))
+
+
+def _prepare_pdf_chunks(file_url: str) -> List[Dict[str, Any]]:
+    """
+    Download, extract and chunk a PDF, and BM25-encode the chunks.
+    Each chunk has its text, starting page, token count and sparse values.
+    """
+    from pdf_extraction import count_pages, extract_pages, page_ranges
+
+    trace = current_trace()
     
     # Download PDF
-    response = requests.get(file_url)
-    response.raise_for_status()
-    pdf_bytes = BytesIO(response.content)
+    with trace.span("pdf_download"):
+        response = requests.get(file_url)
+        response.raise_for_status()
+        pdf_bytes = response.content
     
-    # Extract text from PDF
-    reader = PdfReader(pdf_bytes)
-    full_text = ""
-    for page in reader.pages:
-        full_text += page.extract_text() + "\n\n"
+    # Extract text from PDF: across containers for very large files, otherwise
+    # across this container's cores. Either way pages come back in order.
+    with trace.span("page_extraction"):
+        num_pages = count_pages(pdf_bytes)
+        shard_pages = int(os.environ.get("PDF_SHARD_PAGES", "0"))
+        if shard_pages and num_pages > shard_pages:
+            ranges = page_ranges(num_pages, math.ceil(num_pages / shard_pages))
+            pages = [
+                page
+                for shard in extract_pdf_page_range.starmap(
+                    [(file_url, start, end) for start, end in ranges]
+                )
+                for page in shard
+            ]
+        else:
+            pages = extract_pages(pdf_bytes, end=num_pages, max_workers=_pdf_extraction_workers())
     
     # Chunk text intelligently
-    chunks = _chunk_text_intelligently(full_text, chunk_size=1000, overlap=200)
-    
-    # Initialize BM25 encoder (sparse vectors)
-    bm25_encoder = BM25Encoder()
-    bm25_encoder.fit([chunk["text"] for chunk in chunks])
-    
-    # Generate embeddings for all chunks
-    chunk_texts = [chunk["text"] for chunk in chunks]
-    
-    # Dense embeddings (OpenAI)
-    embedding_response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=chunk_texts,
-    )
-    dense_embeddings = [item.embedding for item in embedding_response.data]
+    with trace.span("chunking"):
+        chunks = _chunk_pages_intelligently(pages, chunk_size=1000, overlap=200)
+    trace.count("tokens", sum(chunk["tokens"] for chunk in chunks), kind="chunked")
     
     # Sparse embeddings (BM25)
-    sparse_embeddings = bm25_encoder.encode_documents(chunk_texts)
+    with trace.span("sparse_encoding"):
+        chunk_texts = [chunk["text"] for chunk in chunks]
+        bm25_encoder = BM25Encoder()
+        bm25_encoder.fit(chunk_texts)
+        for chunk, sparse_values in zip(chunks, bm25_encoder.encode_documents(chunk_texts)):
+            chunk["sparse_values"] = sparse_values
     
-    # Prepare for Pinecone
+    return chunks
+
+
+def _embedding_batches(chunks: List[Dict[str, Any]], max_tokens: int) -> List[List[Dict[str, Any]]]:
+    """Group consecutive chunks into batches of at most `max_tokens` tokens."""
+    batches: List[List[Dict[str, Any]]] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        if not batches or batch_tokens + chunk["tokens"] > max_tokens:
+            batches.append([])
+            batch_tokens = 0
+        batches[-1].append(chunk)
+        batch_tokens += chunk["tokens"]
+    return batches
+
+
+def _embed_texts(texts: List[str]) -> List[List[float]]:
+    """Dense embeddings (OpenAI) for one batch, recorded on the current trace."""
+    trace = current_trace()
+    with trace.span("dense_embedding"):
+        response = _openai_client().embeddings.create(
+            model="text-embedding-3-small",
+            input=texts,
+        )
+    trace.count("tokens", response.usage.total_tokens, kind="embedding")
+    return [item.embedding for item in response.data]
+
+
+def _build_vectors(
+    chunks: List[Dict[str, Any]],
+    dense_embeddings: List[List[float]],
+    file_id: str,
+    course_id: str,
+    user_id: str,
+    file_name: str,
+) -> List[Dict[str, Any]]:
+    """Pinecone upsert records for a file's chunks."""
     vectors_to_upsert = []
     for i, chunk in enumerate(chunks):
         vector_id = f"{file_id}_{i}"
         vectors_to_upsert.append({
             "id": vector_id,
             "values": dense_embeddings[i],
-            "sparse_values": {
-                "indices": list(sparse_embeddings[i].keys()),
-                "values": list(sparse_embeddings[i].values()),
-            },
+            "sparse_values": chunk["sparse_values"],
             "metadata": {
                 "file_id": file_id,
                 "file_name": file_name,
@@ -166,34 +543,111 @@ def process_pdf_and_generate_embeddings(
                 "user_id": user_id,
                 "chunk_index": i,
                 "content": chunk["text"],
-                "page": chunk.get("page", 0),
+                "page": chunk["page"],
             },
         })
+    current_trace().count("vectors", len(vectors_to_upsert), op="generated")
+    return vectors_to_upsert
+
+
+@app.function(
+    image=image,
+    secrets=secrets,
+    timeout=600,
+    cpu=PDF_EXTRACTION_CPU,
+    memory=2048,
+    **STARTUP_OPTIONS,
+)
+@traced
+def process_pdf_and_generate_embeddings(
+    file_url: str,
+    file_id: str,
+    course_id: str,
+    user_id: str,
+    file_name: str,
+    trace_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Process PDF from URL, chunk it, and generate hybrid embeddings (dense + sparse).
+    Returns embeddings ready for Pinecone upsert.
+    """
+    chunks = _prepare_pdf_chunks(file_url)
+    
+    # Dense embeddings (OpenAI), in batches that stay within request limits
+    dense_embeddings = [
+        embedding
+        for batch in _embedding_batches(chunks, EMBEDDING_BATCH_TOKENS)
+        for embedding in _embed_texts([chunk["text"] for chunk in batch])
+    ]
     
     return {
-        "vectors": vectors_to_upsert,
+        "vectors": _build_vectors(chunks, dense_embeddings, file_id, course_id, user_id, file_name),
         "num_chunks": len(chunks),
         "file_id": file_id,
     }
 
 
-def _chunk_text_intelligently(
-    text: str, chunk_size: int = 1000, overlap: int = 200
+@app.function(
+    image=image,
+    secrets=secrets,
+    timeout=600,
+    cpu=PDF_EXTRACTION_CPU,
+    memory=2048,
+    **STARTUP_OPTIONS,
+)
+@traced
+def prepare_pdf_chunks(file_url: str, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    First half of `process_pdf_and_generate_embeddings`: chunks with sparse
+    values but no dense embeddings, so the caller can pace embedding requests.
+    """
+    return _prepare_pdf_chunks(file_url)
+
+
+@app.function(
+    image=image,
+    timeout=600,
+    cpu=PDF_EXTRACTION_CPU,
+    memory=2048,
+    **STARTUP_OPTIONS,
+)
+def extract_pdf_page_range(file_url: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract pages [start, end) of a PDF; one shard of a large file.
+    Returns (page number, text) pairs in page order.
+    """
+    from pdf_extraction import extract_pages
+
+    response = requests.get(file_url)
+    response.raise_for_status()
+    return extract_pages(response.content, start, end, max_workers=_pdf_extraction_workers())
+
+
+def _pdf_extraction_workers() -> int:
+    return int(os.environ.get("PDF_EXTRACTION_WORKERS", PDF_EXTRACTION_CPU))
+
+
+def _chunk_pages_intelligently(
+    pages: List[Tuple[int, str]], chunk_size: int = 1000, overlap: int = 200
 ) -> List[Dict[str, Any]]:
     """
-    Chunk text intelligently by paragraphs, preserving context.
+    Chunk page texts intelligently by paragraphs, preserving context.
+    Each chunk records the page its first new paragraph came from.
     """
-    import tiktoken
-    
-    encoding = tiktoken.encoding_for_model("gpt-4")
+    encoding = _tiktoken_encoding()
     
     # Split by paragraphs first
-    paragraphs = text.split("\n\n")
+    paragraphs = [
+        (page_number, para)
+        for page_number, text in pages
+        for para in text.split("\n\n")
+    ]
     chunks = []
     current_chunk = ""
     current_tokens = 0
+    current_page = paragraphs[0][0] if paragraphs else 0
     
-    for para in paragraphs:
+    for page_number, para in paragraphs:
         para_tokens = len(encoding.encode(para))
         
         if current_tokens + para_tokens > chunk_size and current_chunk:
@@ -201,11 +655,13 @@ def _chunk_text_intelligently(
             chunks.append({
                 "text": current_chunk.strip(),
                 "tokens": current_tokens,
+                "page": current_page,
             })
             # Start new chunk with overlap
             overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
             current_chunk = overlap_text + "\n\n" + para
             current_tokens = len(encoding.encode(current_chunk))
+            current_page = page_number
         else:
             current_chunk += "\n\n" + para if current_chunk else para
             current_tokens += para_tokens
@@ -215,6 +671,7 @@ def _chunk_text_intelligently(
         chunks.append({
             "text": current_chunk.strip(),
             "tokens": current_tokens,
+            "page": current_page,
         })
     
     return chunks
@@ -224,11 +681,19 @@ def _chunk_text_intelligently(
 # Hybrid Search with Pinecone
 # ============================================================================
 
+def _embed_query(query: str) -> List[float]:
+    """Dense embedding for a search query, recorded on the current trace."""
+    return _embed_texts([query])[0]
+
+
 @app.function(
     image=image,
     secrets=secrets,
     timeout=60,
+    **STARTUP_OPTIONS,
+    **INTERACTIVE_WARM_POOL,
 )
+@traced
 def hybrid_search(
     query: str,
     course_id: str,
@@ -236,52 +701,39 @@ def hybrid_search(
     top_k: int = 50,
     alpha: float = 0.5,
     index_name: str = "studylens-ai",
+    dense_vector: Optional[List[float]] = None,
+    trace_id: Optional[str] = None,
 ) -> List[SearchResult]:
     """
     Perform hybrid search (dense + sparse) on Pinecone.
-    Returns top_k candidates for re-ranking.
+    Returns top_k candidates for re-ranking. Pass `dense_vector` when the
+    caller has already embedded the query.
     """
-    import openai
-    from pinecone import Pinecone
-    from pinecone_text.sparse import BM25Encoder
-    import numpy as np
-
-    # Initialize clients
-    openai_client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-    index = pc.Index(index_name)
+    trace = current_trace()
+    index = _pinecone_index(index_name)
     
     # Generate dense embedding for query
-    query_embedding_response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=[query],
-    )
-    dense_vector = query_embedding_response.data[0].embedding
-    
-    # Generate sparse embedding for query (BM25)
-    # Note: In production, you'd want to pre-fit BM25 on your corpus
-    # For now, we'll use a simple approach
-    bm25_encoder = BM25Encoder()
-    # In production, load pre-fitted encoder or fit on corpus
-    sparse_vector = bm25_encoder.encode_queries([query])[0]
-    
-    # Convert sparse vector to Pinecone format
-    sparse_dict = {
-        "indices": list(sparse_vector.keys()),
-        "values": list(sparse_vector.values()),
-    }
+    if dense_vector is None:
+        dense_vector = _embed_query(query)
+    
+    # Generate sparse embedding for query (BM25, already in Pinecone's format)
+    with trace.span("sparse_encoding"):
+        bm25_encoder = _bm25_query_encoder()
+        sparse_vector = bm25_encoder.encode_queries([query])[0]
     
     # Hybrid search on Pinecone
-    results = index.query(
-        vector=dense_vector,
-        sparse_vector=sparse_dict,
-        top_k=top_k,
-        include_metadata=True,
-        filter={
-            "course_id": {"$eq": course_id},
-            "user_id": {"$eq": user_id},
-        },
-    )
+    with trace.span("index_query"):
+        results = index.query(
+            vector=dense_vector,
+            sparse_vector=sparse_vector,
+            top_k=top_k,
+            include_metadata=True,
+            filter={
+                "course_id": {"$eq": course_id},
+                "user_id": {"$eq": user_id},
+            },
+        )
+    trace.count("vectors", len(results.matches), op="retrieved")
     
     # Format results
     search_results = []
@@ -308,32 +760,33 @@ def hybrid_search(
     image=image,
     secrets=secrets,
     timeout=60,
+    **STARTUP_OPTIONS,
+    **INTERACTIVE_WARM_POOL,
 )
+@traced
 def rerank_results(
     query: str,
     candidates: List[SearchResult],
     top_n: int = 5,
+    trace_id: Optional[str] = None,
 ) -> List[SearchResult]:
     """
     Re-rank search candidates using Cohere's Cross-Encoder.
     """
-    import cohere
-    
     if len(candidates) == 0:
         return []
     
-    cohere_client = cohere.Client(api_key=os.environ["COHERE_API_KEY"])
-    
     # Prepare documents for re-ranking
     documents = [candidate.content for candidate in candidates]
     
     # Re-rank
-    rerank_response = cohere_client.rerank(
-        model="rerank-english-v3.0",
-        query=query,
-        documents=documents,
-        top_n=min(top_n, len(candidates)),
-    )
+    with current_trace().span("rerank"):
+        rerank_response = _cohere_client().rerank(
+            model="rerank-english-v3.0",
+            query=query,
+            documents=documents,
+            top_n=min(top_n, len(candidates)),
+        )
     
     # Map re-ranked results back to SearchResult objects
     reranked_results = []
@@ -356,47 +809,27 @@ def rerank_results(
 # LangGraph Agent for Study Plan Generation
 # ============================================================================
 
-@app.function(
-    image=image,
-    secrets=secrets,
-    timeout=300,
-    memory=4096,
-)
-def generate_study_plan(
-    request: StudyPlanRequest,
-    index_name: str = "studylens-ai",
-) -> StudyPlanResponse:
-    """
-    Agentic workflow to generate a structured study plan.
-    Uses LangGraph with Planner -> Retriever -> Writer nodes.
-    """
-    from langchain_openai import ChatOpenAI
-    from langgraph.graph import StateGraph, END
-    from typing import TypedDict
-    import json
+class AgentState(TypedDict):
+    query: str
+    course_id: str
+    user_id: str
+    index_name: str
+    num_days: int
+    focus_topics: List[str]
+    plan: Dict[str, Any]
+    retrieved_content: List[Dict[str, Any]]
+    study_plan: Dict[str, Any]
 
-    # Initialize LLM
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        temperature=0.7,
-        api_key=os.environ["OPENAI_API_KEY"],
-    )
-    
-    # Define state
-    class AgentState(TypedDict):
-        query: str
-        course_id: str
-        user_id: str
-        num_days: int
-        focus_topics: List[str]
-        plan: Dict[str, Any]
-        retrieved_content: List[Dict[str, Any]]
-        study_plan: Dict[str, Any]
-    
-    # Node 1: Planner
-    def planner_node(state: AgentState) -> AgentState:
-        """Decompose query into study plan structure."""
-        prompt = f"""You are a study planning assistant. The user wants to create a {state['num_days']}-day study plan.
+
+def _node_trace(config: "RunnableConfig") -> Trace:
+    # Nodes may run on LangGraph worker threads, so the trace travels in the config
+    return config["configurable"]["trace"]
+
+
+# Node 1: Planner
+def _planner_node(state: AgentState, config: "RunnableConfig") -> AgentState:
+    """Decompose query into study plan structure."""
+    prompt = f"""You are a study planning assistant. The user wants to create a {state['num_days']}-day study plan.
 
 User Query: {state['query']}
 Focus Topics: {', '.join(state.get('focus_topics', [])) if state.get('focus_topics') else 'None specified'}
@@ -421,55 +854,48 @@ Return a JSON structure:
     }}
   ]
 }}"""
+    
+    response = _chat_llm().invoke(prompt)
+    _count_llm_tokens(_node_trace(config), response)
+    plan_json = json.loads(response.content)
+    
+    return {
+        **state,
+        "plan": plan_json,
+    }
+
+
+# Node 2: Retriever
+def _retriever_node(state: AgentState, config: "RunnableConfig") -> AgentState:
+    """Retrieve relevant content for each day's topics."""
+    trace = _node_trace(config)
+    retrieved_content = []
+    index = _pinecone_index(state["index_name"])
+    
+    for day_plan in state["plan"]["days"]:
+        day_content = []
         
-        response = llm.invoke(prompt)
-        plan_json = json.loads(response.content)
-        
-        return {
-            **state,
-            "plan": plan_json,
-        }
-    
-    # Node 2: Retriever
-    def retriever_node(state: AgentState) -> AgentState:
-        """Retrieve relevant content for each day's topics."""
-        import openai
-        from pinecone import Pinecone
-        from pinecone_text.sparse import BM25Encoder
-        import cohere
-        
-        retrieved_content = []
-        
-        # Initialize clients for direct use
-        openai_client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-        index = pc.Index(index_name)
-        cohere_client = cohere.Client(api_key=os.environ["COHERE_API_KEY"])
-        
-        for day_plan in state["plan"]["days"]:
-            day_content = []
-            
-            # Search for each query in the day plan
-            for search_query in day_plan.get("search_queries", []):
-                # Perform hybrid search directly
-                query_embedding_response = openai_client.embeddings.create(
+        # Search for each query in the day plan
+        for search_query in day_plan.get("search_queries", []):
+            # Perform hybrid search directly
+            with trace.span("dense_embedding"):
+                query_embedding_response = _openai_client().embeddings.create(
                     model="text-embedding-3-small",
                     input=[search_query],
                 )
                 dense_vector = query_embedding_response.data[0].embedding
-                
-                # Generate sparse embedding
-                bm25_encoder = BM25Encoder()
+            trace.count("tokens", query_embedding_response.usage.total_tokens, kind="embedding")
+            
+            # Generate sparse embedding
+            with trace.span("sparse_encoding"):
+                bm25_encoder = _bm25_query_encoder()
                 sparse_vector = bm25_encoder.encode_queries([search_query])[0]
-                sparse_dict = {
-                    "indices": list(sparse_vector.keys()),
-                    "values": list(sparse_vector.values()),
-                }
-                
-                # Query Pinecone
+            
+            # Query Pinecone
+            with trace.span("index_query"):
                 results = index.query(
                     vector=dense_vector,
-                    sparse_vector=sparse_dict,
+                    sparse_vector=sparse_vector,
                     top_k=20,
                     include_metadata=True,
                     filter={
@@ -477,54 +903,57 @@ Return a JSON structure:
                         "user_id": {"$eq": state["user_id"]},
                     },
                 )
-                
-                # Format results
-                candidates = []
-                for match in results.matches:
-                    metadata = match.metadata or {}
-                    candidates.append(SearchResult(
-                        content=metadata.get("content", ""),
-                        file_id=metadata.get("file_id", ""),
-                        file_name=metadata.get("file_name", "Unknown"),
-                        score=match.score or 0.0,
-                        metadata=metadata,
-                    ))
-                
-                # Re-rank with Cohere
-                if candidates:
-                    documents = [c.content for c in candidates]
-                    rerank_response = cohere_client.rerank(
+            trace.count("vectors", len(results.matches), op="retrieved")
+            
+            # Format results
+            candidates = []
+            for match in results.matches:
+                metadata = match.metadata or {}
+                candidates.append(SearchResult(
+                    content=metadata.get("content", ""),
+                    file_id=metadata.get("file_id", ""),
+                    file_name=metadata.get("file_name", "Unknown"),
+                    score=match.score or 0.0,
+                    metadata=metadata,
+                ))
+            
+            # Re-rank with Cohere
+            if candidates:
+                documents = [c.content for c in candidates]
+                with trace.span("rerank"):
+                    rerank_response = _cohere_client().rerank(
                         model="rerank-english-v3.0",
                         query=search_query,
                         documents=documents,
                         top_n=min(5, len(candidates)),
                     )
-                    
-                    reranked = []
-                    for result in rerank_response.results:
-                        original = candidates[result.index]
-                        reranked.append({
-                            "content": original.content,
-                            "file_name": original.file_name,
-                            "score": result.relevance_score,
-                        })
-                    
-                    day_content.extend(reranked)
-            
-            retrieved_content.append({
-                "day": day_plan["day"],
-                "content": day_content,
-            })
+                
+                reranked = []
+                for result in rerank_response.results:
+                    original = candidates[result.index]
+                    reranked.append({
+                        "content": original.content,
+                        "file_name": original.file_name,
+                        "score": result.relevance_score,
+                    })
+                
+                day_content.extend(reranked)
         
-        return {
-            **state,
-            "retrieved_content": retrieved_content,
-        }
+        retrieved_content.append({
+            "day": day_plan["day"],
+            "content": day_content,
+        })
     
-    # Node 3: Writer
-    def writer_node(state: AgentState) -> AgentState:
-        """Synthesize retrieved content into final study plan."""
-        prompt = f"""You are creating a comprehensive {state['num_days']}-day study plan.
+    return {
+        **state,
+        "retrieved_content": retrieved_content,
+    }
+
+
+# Node 3: Writer
+def _writer_node(state: AgentState, config: "RunnableConfig") -> AgentState:
+    """Synthesize retrieved content into final study plan."""
+    prompt = f"""You are creating a comprehensive {state['num_days']}-day study plan.
 
 Original Query: {state['query']}
 
@@ -561,20 +990,31 @@ Format as JSON:
   ],
   "sources": ["file1.pdf", "file2.pdf"]
 }}"""
-        
-        response = llm.invoke(prompt)
-        study_plan_json = json.loads(response.content)
-        
-        return {
-            **state,
-            "study_plan": study_plan_json,
-        }
     
-    # Build graph
+    response = _chat_llm().invoke(prompt)
+    _count_llm_tokens(_node_trace(config), response)
+    study_plan_json = json.loads(response.content)
+    
+    return {
+        **state,
+        "study_plan": study_plan_json,
+    }
+
+
+def _timed_node(name: str, node):
+    def run(state: AgentState, config: "RunnableConfig") -> AgentState:
+        with _node_trace(config).span(f"graph.{name}"):
+            return node(state, config)
+    return run
+
+
+@functools.lru_cache(maxsize=None)
+def _study_plan_graph():
+    """Planner -> Retriever -> Writer graph, compiled once per container."""
     workflow = StateGraph(AgentState)
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("retriever", retriever_node)
-    workflow.add_node("writer", writer_node)
+    workflow.add_node("planner", _timed_node("planner", _planner_node))
+    workflow.add_node("retriever", _timed_node("retriever", _retriever_node))
+    workflow.add_node("writer", _timed_node("writer", _writer_node))
     
     # Define edges
     workflow.set_entry_point("planner")
@@ -582,13 +1022,32 @@ Format as JSON:
     workflow.add_edge("retriever", "writer")
     workflow.add_edge("writer", END)
     
-    # Compile and run
-    app = workflow.compile()
-    
+    return workflow.compile()
+
+
+@app.function(
+    image=image,
+    secrets=secrets,
+    timeout=300,
+    memory=4096,
+    **STARTUP_OPTIONS,
+    **INTERACTIVE_WARM_POOL,
+)
+@traced
+def generate_study_plan(
+    request: StudyPlanRequest,
+    index_name: str = "studylens-ai",
+    trace_id: Optional[str] = None,
+) -> StudyPlanResponse:
+    """
+    Agentic workflow to generate a structured study plan.
+    Uses LangGraph with Planner -> Retriever -> Writer nodes.
+    """
     initial_state: AgentState = {
         "query": request.query,
         "course_id": request.course_id,
         "user_id": request.user_id,
+        "index_name": index_name,
         "num_days": request.num_days or 3,
         "focus_topics": request.focus_topics or [],
         "plan": {},
@@ -596,7 +1055,10 @@ Format as JSON:
         "study_plan": {},
     }
     
-    final_state = app.invoke(initial_state)
+    final_state = _study_plan_graph().invoke(
+        initial_state,
+        config={"configurable": {"trace": current_trace()}},
+    )
     
     return StudyPlanResponse(
         plan=final_state["study_plan"],
@@ -605,6 +1067,13 @@ Format as JSON:
     )
 
 
+def _count_llm_tokens(trace: Trace, response: Any) -> None:
+    """Record prompt/completion token usage from a LangChain chat response."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    trace.count("tokens", usage.get("input_tokens", 0), kind="llm_prompt")
+    trace.count("tokens", usage.get("output_tokens", 0), kind="llm_completion")
+
+
 # ============================================================================
 # Pinecone Management
 # ============================================================================
@@ -613,25 +1082,27 @@ Format as JSON:
     image=image,
     secrets=secrets,
     timeout=60,
+    **STARTUP_OPTIONS,
 )
+@traced
 def upsert_to_pinecone(
     vectors: List[Dict[str, Any]],
     index_name: str = "studylens-ai",
+    trace_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Upsert vectors to Pinecone index."""
-    from pinecone import Pinecone
-    
-    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-    index = pc.Index(index_name)
+    index = _pinecone_index(index_name)
     
     # Batch upsert (Pinecone supports up to 100 vectors per request)
     batch_size = 100
     total_upserted = 0
     
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i : i + batch_size]
-        index.upsert(vectors=batch)
-        total_upserted += len(batch)
+    with current_trace().span("upsert"):
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i : i + batch_size]
+            index.upsert(vectors=batch)
+            total_upserted += len(batch)
+    current_trace().count("vectors", total_upserted, op="upserted")
     
     return {
         "success": True,
@@ -643,65 +1114,544 @@ def upsert_to_pinecone(
     image=image,
     secrets=secrets,
     timeout=60,
+    **STARTUP_OPTIONS,
 )
+@traced
 def delete_from_pinecone(
     file_id: str,
     index_name: str = "studylens-ai",
+    trace_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Delete all vectors for a file from Pinecone."""
-    from pinecone import Pinecone
-    
-    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-    index = pc.Index(index_name)
+    index = _pinecone_index(index_name)
     
+    trace = current_trace()
+
     # Query to find all vectors for this file
-    results = index.query(
-        vector=[0.0] * 1536,  # Dummy vector
-        top_k=10000,
-        include_metadata=True,
-        filter={"file_id": {"$eq": file_id}},
-    )
+    with trace.span("index_query"):
+        results = index.query(
+            vector=[0.0] * 1536,  # Dummy vector
+            top_k=10000,
+            include_metadata=True,
+            filter={"file_id": {"$eq": file_id}},
+        )
     
     # Delete all matching vectors
     ids_to_delete = [match.id for match in results.matches]
+    course_ids = sorted({
+        match.metadata["course_id"]
+        for match in results.matches
+        if match.metadata and "course_id" in match.metadata
+    })
     
     if ids_to_delete:
-        index.delete(ids=ids_to_delete)
+        with trace.span("delete"):
+            index.delete(ids=ids_to_delete)
+    trace.count("vectors", len(ids_to_delete), op="deleted")
     
     return {
         "success": True,
         "vectors_deleted": len(ids_to_delete),
+        "course_ids": course_ids,
     }
 
 
+# ============================================================================
+# Upstream Rate Limiting & Admission Control
+# ============================================================================
+
+class Priority(IntEnum):
+    """Scheduling class for upstream calls. Lower values are served first."""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; `status_code` is the HTTP status to return."""
+    status_code = 400
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SchedulerSaturated(AdmissionRejected):
+    """Quota or queue exhausted for now; carries a Retry-After hint in seconds."""
+    status_code = 429
+
+
+class RequestTooLarge(AdmissionRejected):
+    """Costs more than a bucket can ever grant at once, so retrying cannot succeed."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens/sec up to `capacity`.
+    One token is one upstream API request, except for the `embedding_tokens`
+    bucket, which counts OpenAI embedding input tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until `amount` tokens can be taken without dipping into `reserve`.
+        `amount` must not exceed `capacity - reserve`.
+        """
+        self.refill()
+        needed = amount + reserve - self.tokens
+        return max(needed, 0.0) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.refill()
+        self.tokens -= amount
+
+
+class UpstreamScheduler:
+    """
+    Admission control for calls that spend the shared OpenAI, Pinecone and Cohere quotas.
+
+    Waiting requests are served by priority, then arrival order, and a request
+    only blocks later ones that need the same provider. Batch requests may not
+    drain a bucket below `batch_reserve` of its capacity, so interactive
+    traffic keeps headroom during ingestion bursts. Queues are bounded per
+    class, and requests whose estimated wait exceeds the class budget are
+    rejected up front so callers get a fast 429 instead of a slow timeout.
+    Requests costing more than a bucket can hold (less the reserve) could
+    never be granted without going into debt, and are rejected with a 400.
+    """
+
+    def __init__(
+        self,
+        buckets: Dict[str, TokenBucket],
+        max_queue: Dict[Priority, int],
+        max_wait: Dict[Priority, float],
+        batch_reserve: float = 0.3,
+    ):
+        self.buckets = buckets
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.batch_reserve = batch_reserve
+        self._waiters: List[tuple] = []  # (priority, seq, costs, future), kept sorted
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _reserve(self, provider: str, priority: Priority) -> float:
+        if priority == Priority.BATCH:
+            return self.buckets[provider].capacity * self.batch_reserve
+        return 0.0
+
+    def max_cost(self, provider: str, priority: Priority) -> float:
+        """Largest cost on `provider` that a single request of `priority` may ask for."""
+        return self.buckets[provider].capacity - self._reserve(provider, priority)
+
+    def _wait_time(self, costs: Dict[str, float], priority: Priority) -> float:
+        return max(
+            self.buckets[p].wait_time(c, self._reserve(p, priority))
+            for p, c in costs.items()
+        )
+
+    def _estimate_wait(self, costs: Dict[str, float], priority: Priority) -> float:
+        """Time for each provider to drain the backlog queued ahead of this request."""
+        estimate = 0.0
+        for provider, cost in costs.items():
+            bucket = self.buckets[provider]
+            bucket.refill()
+            backlog = sum(
+                w_costs.get(provider, 0.0)
+                for w_priority, _, w_costs, _ in self._waiters
+                if w_priority <= priority
+            )
+            deficit = backlog + cost + self._reserve(provider, priority) - bucket.tokens
+            estimate = max(estimate, deficit / bucket.rate)
+        return estimate
+
+    def queue_depth(self, priority: Priority) -> int:
+        return sum(1 for w in self._waiters if w[0] == priority)
+
+    async def acquire(self, costs: Dict[str, float], priority: Priority) -> None:
+        """Wait until `costs` (provider -> requests) can be spent, or raise AdmissionRejected."""
+        costs = {p: float(c) for p, c in costs.items() if c > 0}
+        if not costs:
+            return
+
+        label = priority.name.lower()
+        for provider, cost in costs.items():
+            limit = self.max_cost(provider, priority)
+            if cost > limit:
+                raise RequestTooLarge(
+                    f"{label} request needs {cost:g} {provider} tokens, "
+                    f"more than the {limit:g} one request may use"
+                )
+        estimate = self._estimate_wait(costs, priority)
+        if self.queue_depth(priority) >= self.max_queue[priority]:
+            raise SchedulerSaturated(f"{label} queue is full", max(estimate, 1.0))
+        if estimate > self.max_wait[priority]:
+            raise SchedulerSaturated(f"{label} upstream quota exhausted", estimate)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), costs, future)
+        self._waiters.append(entry)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait[priority])
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._abandon(entry)
+                raise SchedulerSaturated(
+                    f"{label} request timed out waiting for upstream quota",
+                    self._estimate_wait(costs, priority),
+                )
+        except asyncio.CancelledError:
+            if not future.done():
+                self._abandon(entry)
+            raise
+
+    def _abandon(self, entry: tuple) -> None:
+        self._waiters.remove(entry)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant every waiter that fits now and schedule a wake-up for the rest."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._waiters.sort(key=lambda w: (w[0], w[1]))
+        blocked: set = set()
+        next_wake = math.inf
+        remaining = []
+        for entry in self._waiters:
+            priority, _, costs, future = entry
+            if blocked.isdisjoint(costs):
+                wait = self._wait_time(costs, priority)
+                if wait <= 0:
+                    for provider, cost in costs.items():
+                        self.buckets[provider].consume(cost)
+                    future.set_result(None)
+                    continue
+                next_wake = min(next_wake, wait)
+            blocked.update(costs)
+            remaining.append(entry)
+
+        self._waiters = remaining
+        if remaining:
+            self._timer = asyncio.get_running_loop().call_later(next_wake, self._dispatch)
+
+
+# Study plans issue roughly this many search queries per day of the plan,
+# each a short phrase of about this many tokens
+STUDY_PLAN_QUERIES_PER_DAY = 2
+STUDY_PLAN_QUERY_TOKENS = 32
+
+_scheduler: Optional[UpstreamScheduler] = None
+
+
+def get_scheduler() -> UpstreamScheduler:
+    """
+    Per-container scheduler singleton. The web endpoint runs in a single
+    container so these buckets see all traffic to the service.
+    """
+    global _scheduler
+    if _scheduler is None:
+        env = os.environ.get
+        _scheduler = UpstreamScheduler(
+            buckets={
+                "openai": TokenBucket(
+                    rate=float(env("OPENAI_RATE_LIMIT_RPS", "20")),
+                    capacity=float(env("OPENAI_RATE_LIMIT_BURST", "40")),
+                ),
+                "embedding_tokens": TokenBucket(
+                    rate=float(env("EMBEDDING_RATE_LIMIT_TPS", "10000")),
+                    capacity=float(env("EMBEDDING_RATE_LIMIT_BURST", "100000")),
+                ),
+                "pinecone": TokenBucket(
+                    rate=float(env("PINECONE_RATE_LIMIT_RPS", "50")),
+                    capacity=float(env("PINECONE_RATE_LIMIT_BURST", "100")),
+                ),
+                "cohere": TokenBucket(
+                    rate=float(env("COHERE_RATE_LIMIT_RPS", "10")),
+                    capacity=float(env("COHERE_RATE_LIMIT_BURST", "20")),
+                ),
+            },
+            max_queue={
+                Priority.INTERACTIVE: int(env("INTERACTIVE_MAX_QUEUE", "200")),
+                Priority.BATCH: int(env("BATCH_MAX_QUEUE", "50")),
+            },
+            max_wait={
+                Priority.INTERACTIVE: float(env("INTERACTIVE_MAX_WAIT_SECONDS", "10")),
+                Priority.BATCH: float(env("BATCH_MAX_WAIT_SECONDS", "30")),
+            },
+            batch_reserve=float(env("BATCH_RESERVE_FRACTION", "0.3")),
+        )
+    return _scheduler
+
+
+def _rejected_response(exc: AdmissionRejected) -> JSONResponse:
+    if exc.retry_after is None:
+        return JSONResponse(content={"error": str(exc)}, status_code=exc.status_code)
+    retry_after = max(1, math.ceil(exc.retry_after))
+    return JSONResponse(
+        content={"error": str(exc), "retry_after": retry_after},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+# ============================================================================
+# Semantic Query Cache
+# ============================================================================
+
+# (course_id, user_id, top_k, top_n): results are only reused for identical
+# search parameters
+CacheKey = Tuple[str, str, int, int]
+
+
+class _CachedQueries:
+    """Query embeddings (one unit vector per row) and their results for one cache key."""
+
+    def __init__(self, dim: int):
+        self.embeddings = np.empty((0, dim), dtype=np.float32)
+        self.last_used = np.empty(0, dtype=np.int64)
+        self.results: List[Any] = []
+
+
+class SemanticCache:
+    """
+    Recent reranked search results per course, looked up by query embedding.
+
+    Differently worded questions about the same topic ("what is backprop",
+    "explain backpropagation") have nearby embeddings. A query whose cosine
+    similarity to a cached query reaches `threshold` reuses that query's
+    results instead of running hybrid search and rerank again. Each key's
+    embeddings are kept in one matrix, so a lookup is a single matrix-vector
+    product. Each key holds at most `max_entries` queries and at most
+    `max_keys` keys are kept; both evict least recently used first.
+
+    Invalidated per course whenever that course's vectors change. Generations
+    guard against storing results computed while an invalidation happened.
+    Used only from the web container's event loop, so it needs no locking.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, max_keys: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[CacheKey, _CachedQueries]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._clock = itertools.count()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> "np.ndarray":
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def generation(self, course_id: str) -> Tuple[int, int]:
+        """Take before computing results; pass to `store` afterwards."""
+        return self._epoch, self._generations.get(course_id, 0)
+
+    def lookup(self, key: CacheKey, embedding: Sequence[float]) -> Optional[Any]:
+        cached = self._keys.get(key)
+        if cached is None or not cached.results:
+            return None
+        similarities = cached.embeddings @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        cached.last_used[best] = next(self._clock)
+        self._keys.move_to_end(key)
+        return cached.results[best]
+
+    def store(
+        self,
+        key: CacheKey,
+        embedding: Sequence[float],
+        results: Any,
+        generation: Tuple[int, int],
+    ) -> None:
+        if self.max_entries <= 0 or self.max_keys <= 0 or generation != self.generation(key[0]):
+            return
+        vector = self._normalize(embedding)
+        cached = self._keys.get(key)
+        if cached is None:
+            cached = self._keys[key] = _CachedQueries(len(vector))
+            while len(self._keys) > self.max_keys:
+                _, evicted = self._keys.popitem(last=False)
+                CACHE_EVICTIONS.inc(len(evicted.results), cache="semantic", reason="lru")
+        self._keys.move_to_end(key)
+
+        tick = next(self._clock)
+        if len(cached.results) < self.max_entries:
+            cached.embeddings = np.vstack([cached.embeddings, vector])
+            cached.last_used = np.append(cached.last_used, tick)
+            cached.results.append(results)
+        else:
+            slot = int(np.argmin(cached.last_used))
+            cached.embeddings[slot] = vector
+            cached.last_used[slot] = tick
+            cached.results[slot] = results
+            CACHE_EVICTIONS.inc(cache="semantic", reason="lru")
+
+    def invalidate(self, course_id: str) -> None:
+        """Drop a course's cached results after its vectors changed."""
+        self._generations[course_id] = self._generations.get(course_id, 0) + 1
+        for key in [key for key in self._keys if key[0] == course_id]:
+            evicted = self._keys.pop(key)
+            CACHE_EVICTIONS.inc(len(evicted.results), cache="semantic", reason="invalidated")
+
+    def clear(self) -> None:
+        """Drop everything, for changes whose course is unknown."""
+        self._epoch += 1
+        for evicted in self._keys.values():
+            CACHE_EVICTIONS.inc(len(evicted.results), cache="semantic", reason="invalidated")
+        self._keys.clear()
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Per-container cache singleton. Like the scheduler, it lives in the single
+    web container, which also sees every upsert and delete to invalidate on.
+    """
+    global _semantic_cache
+    if _semantic_cache is None:
+        env = os.environ.get
+        _semantic_cache = SemanticCache(
+            threshold=float(env("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(env("SEMANTIC_CACHE_MAX_ENTRIES", "128")),
+            max_keys=int(env("SEMANTIC_CACHE_MAX_COURSES", "256")),
+        )
+    return _semantic_cache
+
+
 # ============================================================================
 # FastAPI HTTP Endpoints
 # ============================================================================
 
+async def _admit(costs: Dict[str, float], priority: Priority) -> None:
+    """Acquire upstream quota for the current request, timing the wait."""
+    with current_trace().span("admission"):
+        try:
+            await get_scheduler().acquire(costs, priority)
+        except AdmissionRejected:
+            ADMISSION_REJECTED.inc(priority=priority.name.lower())
+            raise
+
+
+def _query_tokens(query: str) -> int:
+    return len(_tiktoken_encoding().encode(query))
+
+
+async def _call_remote(function: Any, *args: Any, **kwargs: Any) -> Any:
+    """Call a traced Modal function and merge its stage timings into the current trace."""
+    trace = current_trace()
+    response = await function.remote.aio(*args, trace_id=trace.id, **kwargs)
+    trace.merge(response["trace"])
+    return response["result"]
+
+
+def _error_response(exc: Exception) -> JSONResponse:
+    logger.exception("Request failed (trace %s)", current_trace().id)
+    return JSONResponse(
+        content={"error": str(exc)},
+        status_code=500,
+    )
+
+
+@web_app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Record request latency and stage timings, optionally exposing them as Server-Timing."""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_trace.reset(token)
+
+    route = request.scope.get("route")
+    endpoint = route.path.lstrip("/") if route is not None else "unmatched"
+    trace.record()
+    REQUEST_SECONDS.observe(trace.elapsed(), endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if TIMING_HEADERS_ENABLED or request.headers.get("x-studylens-timing"):
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-StudyLens-Trace-Id"] = trace.id
+    return response
+
+
+@web_app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint for this container."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @web_app.post("/process_pdf_and_generate_embeddings")
 async def process_pdf_endpoint(request: Dict[str, Any]):
-    """HTTP endpoint for PDF processing."""
+    """
+    HTTP endpoint for PDF processing. Chunks are prepared remotely, then
+    embedded here one batch at a time, each admitted against the embedding
+    token quota, so large uploads are paced instead of spending it in one burst.
+    """
     try:
-        result = process_pdf_and_generate_embeddings.remote(
-            file_url=request["file_url"],
+        chunks = await _call_remote(prepare_pdf_chunks, file_url=request["file_url"])
+        batch_tokens = min(
+            EMBEDDING_BATCH_TOKENS,
+            get_scheduler().max_cost("embedding_tokens", Priority.BATCH),
+        )
+        dense_embeddings: List[List[float]] = []
+        for batch in _embedding_batches(chunks, batch_tokens):
+            await _admit(
+                {"openai": 1, "embedding_tokens": sum(chunk["tokens"] for chunk in batch)},
+                Priority.BATCH,
+            )
+            texts = [chunk["text"] for chunk in batch]
+            dense_embeddings.extend(await asyncio.to_thread(_embed_texts, texts))
+        vectors = _build_vectors(
+            chunks,
+            dense_embeddings,
             file_id=request["file_id"],
             course_id=request["course_id"],
             user_id=request["user_id"],
             file_name=request["file_name"],
         )
-        return JSONResponse(content=result)
+        return JSONResponse(content={
+            "vectors": vectors,
+            "num_chunks": len(chunks),
+            "file_id": request["file_id"],
+        })
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
-        )
+        return _error_response(e)
 
 
 @web_app.post("/hybrid_search")
 async def hybrid_search_endpoint(request: Dict[str, Any]):
     """HTTP endpoint for hybrid search."""
     try:
-        results = hybrid_search.remote(
+        await _admit(
+            {"openai": 1, "embedding_tokens": _query_tokens(request["query"]), "pinecone": 1},
+            Priority.INTERACTIVE,
+        )
+        results = await _call_remote(
+            hybrid_search,
             query=request["query"],
             course_id=request["course_id"],
             user_id=request["user_id"],
@@ -709,11 +1659,10 @@ async def hybrid_search_endpoint(request: Dict[str, Any]):
         )
         # Convert Pydantic models to dicts
         return JSONResponse(content=[r.dict() for r in results])
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
-        )
+        return _error_response(e)
 
 
 @web_app.post("/rerank_results")
@@ -722,17 +1671,67 @@ async def rerank_endpoint(request: Dict[str, Any]):
     try:
         # Convert dicts to SearchResult objects
         candidates = [SearchResult(**c) for c in request["candidates"]]
-        results = rerank_results.remote(
+        await _admit({"cohere": 1 if candidates else 0}, Priority.INTERACTIVE)
+        results = await _call_remote(
+            rerank_results,
             query=request["query"],
             candidates=candidates,
             top_n=request.get("top_n", 5),
         )
         return JSONResponse(content=[r.dict() for r in results])
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
+        return _error_response(e)
+
+
+@web_app.post("/search")
+async def search_endpoint(request: Dict[str, Any]):
+    """
+    HTTP endpoint for hybrid search followed by re-ranking. Served from the
+    semantic cache when a similar query was recently answered for the course.
+    """
+    try:
+        trace = current_trace()
+        cache = get_semantic_cache()
+        query = request["query"]
+        course_id = request["course_id"]
+        top_k = request.get("top_k", 50)
+        top_n = request.get("top_n", 5)
+        key = (course_id, request["user_id"], top_k, top_n)
+        generation = cache.generation(course_id)
+
+        await _admit({"openai": 1, "embedding_tokens": _query_tokens(query)}, Priority.INTERACTIVE)
+        embedding = await asyncio.to_thread(_embed_query, query)
+        with trace.span("cache_lookup"):
+            cached = cache.lookup(key, embedding)
+        trace.count("cache_lookups", cache="semantic", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return JSONResponse(content=cached)
+
+        await _admit({"pinecone": 1}, Priority.INTERACTIVE)
+        candidates = await _call_remote(
+            hybrid_search,
+            query=query,
+            course_id=course_id,
+            user_id=request["user_id"],
+            top_k=top_k,
+            dense_vector=embedding,
+        )
+        await _admit({"cohere": 1 if candidates else 0}, Priority.INTERACTIVE)
+        results = await _call_remote(
+            rerank_results,
+            query=query,
+            candidates=candidates,
+            top_n=top_n,
         )
+        content = [r.dict() for r in results]
+        cache.store(key, embedding, content, generation)
+        return JSONResponse(content=content)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
+    except Exception as e:
+        return _error_response(e)
 
 
 @web_app.post("/generate_study_plan")
@@ -740,47 +1739,90 @@ async def generate_study_plan_endpoint(request: Dict[str, Any]):
     """HTTP endpoint for study plan generation."""
     try:
         study_plan_request = StudyPlanRequest(**request)
-        result = generate_study_plan.remote(study_plan_request)
+        num_queries = (study_plan_request.num_days or 3) * STUDY_PLAN_QUERIES_PER_DAY
+        await _admit(
+            # Planner + writer LLM calls, then one embed/query/rerank per search query
+            {
+                "openai": 2 + num_queries,
+                "embedding_tokens": num_queries * STUDY_PLAN_QUERY_TOKENS,
+                "pinecone": num_queries,
+                "cohere": num_queries,
+            },
+            Priority.INTERACTIVE,
+        )
+        result = await _call_remote(generate_study_plan, study_plan_request)
         return JSONResponse(content=result.dict())
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
-        )
+        return _error_response(e)
 
 
 @web_app.post("/upsert_to_pinecone")
 async def upsert_endpoint(request: Dict[str, Any]):
     """HTTP endpoint for Pinecone upsert."""
     try:
-        result = upsert_to_pinecone.remote(
-            vectors=request["vectors"],
-        )
+        # upsert_to_pinecone sends batches of 100 vectors
+        num_batches = math.ceil(len(request["vectors"]) / 100)
+        await _admit({"pinecone": num_batches}, Priority.BATCH)
+        course_ids = {(v.get("metadata") or {}).get("course_id") for v in request["vectors"]}
+        try:
+            result = await _call_remote(
+                upsert_to_pinecone,
+                vectors=request["vectors"],
+            )
+        finally:
+            # Invalidate even after a failure: some batches may have landed
+            for course_id in course_ids - {None}:
+                get_semantic_cache().invalidate(course_id)
         return JSONResponse(content=result)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
-        )
+        return _error_response(e)
 
 
 @web_app.post("/delete_from_pinecone")
 async def delete_endpoint(request: Dict[str, Any]):
     """HTTP endpoint for Pinecone deletion."""
     try:
-        result = delete_from_pinecone.remote(
-            file_id=request["file_id"],
-        )
+        # One query to list the file's vectors, one delete
+        await _admit({"pinecone": 2}, Priority.BATCH)
+        try:
+            result = await _call_remote(
+                delete_from_pinecone,
+                file_id=request["file_id"],
+            )
+        except Exception:
+            # The file's course is unknown, and vectors may have been deleted
+            get_semantic_cache().clear()
+            raise
+        for course_id in result["course_ids"]:
+            get_semantic_cache().invalidate(course_id)
         return JSONResponse(content=result)
+    except AdmissionRejected as e:
+        return _rejected_response(e)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=500,
-        )
+        return _error_response(e)
 
 
-# Mount FastAPI app to Modal
-@app.asgi_app()
+# Mount FastAPI app to Modal. A single container keeps the scheduler's token
+# buckets authoritative; the endpoints only await remote calls, so one
+# container handles many concurrent requests.
+@app.function(
+    image=image,
+    secrets=secrets,
+    max_containers=1,
+    **STARTUP_OPTIONS,
+    **WEB_WARM_POOL,
+)
+@modal.concurrent(max_inputs=500)
+@modal.asgi_app()
 def fastapi_app():
     return web_app
 
+
+# Prepare per-container state at import time inside Modal containers, so it
+# is captured by memory snapshots instead of paid on the first request
+if os.environ.get("STUDYLENS_PRELOAD") == "1":
+    _preload()
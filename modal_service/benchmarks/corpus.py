@@ -0,0 +1,164 @@
+"""
+Synthetic PDF corpus for offline benchmarks.
+
+PDFs are written directly (one Helvetica text block per page) so no PDF
+authoring library is needed; pypdf extracts the text back line by line.
+"""
+
+import random
+from pathlib import Path
+from typing import List, Dict, Any
+
+TOPICS: Dict[str, List[str]] = {
+    "machine learning": [
+        "gradient descent", "backpropagation", "loss function", "regularization",
+        "overfitting", "learning rate", "neural network", "activation function",
+        "convolution", "dropout", "batch normalization", "cross validation",
+    ],
+    "databases": [
+        "normalization", "transaction", "isolation level", "b-tree index",
+        "query planner", "join algorithm", "write-ahead log", "replication",
+        "primary key", "foreign key", "deadlock", "materialized view",
+    ],
+    "operating systems": [
+        "process scheduling", "virtual memory", "page table", "context switch",
+        "mutex", "semaphore", "file system", "interrupt handler",
+        "system call", "thrashing", "paging", "kernel mode",
+    ],
+    "biology": [
+        "cell membrane", "mitochondria", "photosynthesis", "natural selection",
+        "gene expression", "protein synthesis", "enzyme kinetics", "homeostasis",
+        "meiosis", "mitosis", "ribosome", "cellular respiration",
+    ],
+}
+
+_TEMPLATES = [
+    "The concept of {a} is closely related to {b} in {topic}.",
+    "Students often confuse {a} with {b}, but they solve different problems.",
+    "A common exam question asks how {a} affects {b}.",
+    "In practice, {a} is applied before {b} to improve results.",
+    "Understanding {a} requires a solid grasp of {b}.",
+    "Chapter examples show {a} interacting with {b} under load.",
+    "The textbook defines {a} formally and then contrasts it with {b}.",
+]
+
+LINES_PER_PAGE = 48
+LINE_WIDTH = 90
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def write_pdf(path: Path, pages: List[List[str]]) -> None:
+    """Write a minimal valid PDF with one text line per list entry."""
+    num_pages = len(pages)
+    # Object layout: 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    page_ids = [4 + 2 * i for i in range(num_pages)]
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            "<< /Type /Pages /Kids ["
+            + " ".join(f"{pid} 0 R" for pid in page_ids)
+            + f"] /Count {num_pages} >>"
+        ).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, lines in zip(page_ids, pages):
+        body = "BT /F1 10 Tf 14 TL 50 760 Td\n" + "".join(
+            f"({_escape(line)}) Tj T*\n" for line in lines
+        ) + "ET"
+        stream = body.encode("latin-1", errors="replace")
+        objects.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+            ).encode()
+        )
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    path.write_bytes(bytes(out))
+
+
+def _page_lines(rng: random.Random, topic: str, terms: List[str]) -> List[str]:
+    lines: List[str] = []
+    while len(lines) < LINES_PER_PAGE:
+        sentences = [
+            rng.choice(_TEMPLATES).format(a=a, b=b, topic=topic)
+            for a, b in (rng.sample(terms, 2) for _ in range(rng.randint(3, 6)))
+        ]
+        lines.extend(_wrap(" ".join(sentences), LINE_WIDTH))
+        lines.append("")  # blank line between paragraphs
+    return lines[:LINES_PER_PAGE]
+
+
+def generate_corpus(
+    out_dir: Path, num_files: int, pages_per_file: int, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Write `num_files` PDFs of `pages_per_file` pages each into `out_dir`.
+    Returns one record per file with its name, path, topic, page count and text.
+    """
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(num_files):
+        topic = topics[i % len(topics)]
+        pages = [_page_lines(rng, topic, TOPICS[topic]) for _ in range(pages_per_file)]
+        name = f"lecture_{i:03d}.pdf"
+        write_pdf(out_dir / name, pages)
+        files.append({
+            "name": name,
+            "path": out_dir / name,
+            "topic": topic,
+            "pages": pages_per_file,
+            "text": "\n\n".join("\n".join(lines) for lines in pages),
+        })
+    return files
+
+
+def generate_queries(num_queries: int, seed: int = 0) -> List[str]:
+    """Student-style questions about terms that appear in the corpus."""
+    rng = random.Random(seed + 1)
+    phrasings = [
+        "what is {term}",
+        "explain {term} in {topic}",
+        "how does {term} work",
+        "difference between {term} and {other}",
+        "why is {term} important for the exam",
+    ]
+    queries = []
+    for _ in range(num_queries):
+        topic = rng.choice(sorted(TOPICS))
+        term, other = rng.sample(TOPICS[topic], 2)
+        queries.append(rng.choice(phrasings).format(term=term, other=other, topic=topic))
+    return queries
@@ -0,0 +1,114 @@
+"""
+PDF text extraction throughput (pages/sec) against worker process count.
+
+    cd modal_service
+    python -m benchmarks.extraction --pages 300 --workers 1 2 4 8
+
+Each worker count runs once to warm the process pool and then `--repeat`
+more times; the best run is reported. extract_pages gives each process at
+least MIN_PAGES_PER_WORKER pages, so a short PDF can use fewer processes
+than requested; both counts are reported. Results are written as JSON next
+to the pipeline benchmark results.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import RESULTS_DIR, _git_commit
+from pdf_extraction import MIN_PAGES_PER_WORKER, effective_workers, extract_pages
+
+
+def _default_worker_counts() -> List[int]:
+    counts, n = [], 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def _time(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300, help="pages in the generated PDF")
+    parser.add_argument("--workers", type=int, nargs="+", help="worker counts (default: 1, 2, 4, ... cpu_count)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/extraction-<time>-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    worker_counts = args.workers or _default_worker_counts()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        record = generate_corpus(Path(tmp), 1, args.pages, seed=args.seed)[0]
+        pdf_bytes = record["path"].read_bytes()
+
+    runs = []
+    baseline_rate = None
+    for requested in worker_counts:
+        workers = effective_workers(args.pages, requested)
+        if workers < requested:
+            print(
+                f"warning: {requested} workers requested but {args.pages} pages only support {workers} "
+                f"(at least {MIN_PAGES_PER_WORKER} pages each); use more --pages",
+                file=sys.stderr,
+            )
+        extract_pages(pdf_bytes, max_workers=requested)  # warm the pool
+        best = min(
+            _time(lambda: extract_pages(pdf_bytes, max_workers=requested))
+            for _ in range(args.repeat)
+        )
+        rate = args.pages / best
+        baseline_rate = baseline_rate or rate
+        runs.append({
+            "requested_workers": requested,
+            "workers": workers,
+            "seconds": best,
+            "pages_per_sec": rate,
+            "speedup": rate / baseline_rate,
+        })
+        print(
+            f"{workers:>3} workers ({requested} requested): {rate:8.1f} pages/sec ({rate / baseline_rate:.2f}x)",
+            file=sys.stderr,
+        )
+
+    commit = _git_commit()
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {"pages": args.pages, "repeat": args.repeat, "seed": args.seed},
+        "pdf_bytes": len(pdf_bytes),
+        "runs": runs,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = RESULTS_DIR / f"extraction-{stamp}-{(commit or 'nogit')[:8]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(json.dumps(runs, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    main()
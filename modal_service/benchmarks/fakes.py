@@ -0,0 +1,331 @@
+"""
+Local stand-ins for the OpenAI, Pinecone and Cohere HTTP APIs.
+
+Each fake speaks just enough of the real wire format for the official
+clients used in app.py, with configurable latency and error injection.
+Embeddings are feature-hashed bags of words so that similar texts get
+similar vectors and search results stay meaningful.
+"""
+
+import asyncio
+import base64
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+EMBEDDING_DIM = 1536
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+@dataclass
+class FaultConfig:
+    """Latency and error injection applied to every request of one fake."""
+    latency_ms: float = 0.0
+    jitter: float = 0.0  # +/- fraction of latency_ms
+    error_rate: float = 0.0
+    error_status: int = 503
+
+
+def _add_fault_injection(app: FastAPI, faults: FaultConfig, seed: int) -> None:
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def inject(request: Request, call_next):
+        if faults.latency_ms > 0:
+            spread = faults.latency_ms * faults.jitter
+            await asyncio.sleep(max(0.0, faults.latency_ms + rng.uniform(-spread, spread)) / 1000)
+        if faults.error_rate > 0 and rng.random() < faults.error_rate:
+            return JSONResponse(
+                content={"error": {"message": "injected fault", "type": "server_error"}},
+                status_code=faults.error_status,
+                headers={"Retry-After": "0"},
+            )
+        return await call_next(request)
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def embed_text(text: str) -> np.ndarray:
+    """Deterministic unit vector from feature-hashed tokens."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in _tokens(text):
+        h = zlib.crc32(token.encode())
+        vector[h % EMBEDDING_DIM] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# ----------------------------------------------------------------------------
+# OpenAI
+# ----------------------------------------------------------------------------
+
+def _fake_plan(prompt: str) -> Dict[str, Any]:
+    days_match = re.search(r"(\d+)-day", prompt)
+    num_days = int(days_match.group(1)) if days_match else 3
+    query_match = re.search(r"User Query: (.*)", prompt)
+    words = _tokens(query_match.group(1) if query_match else "study") or ["study"]
+    return {
+        "days": [
+            {
+                "day": day,
+                "topics": [" ".join(words[:3])],
+                "subtopics": words[:2],
+                "key_terms": words[:3],
+                "search_queries": [
+                    f"what is {' '.join(words[:3])}",
+                    f"examples of {' '.join(words[-2:])} day {day}",
+                ],
+            }
+            for day in range(1, num_days + 1)
+        ]
+    }
+
+
+def _fake_study_plan(prompt: str) -> Dict[str, Any]:
+    days_match = re.search(r"(\d+)-day", prompt)
+    num_days = int(days_match.group(1)) if days_match else 3
+    sources = sorted(set(re.findall(r'"file_name": "([^"]+)"', prompt)))
+    return {
+        "overview": "Benchmark study plan",
+        "days": [
+            {
+                "day": day,
+                "title": f"Day {day}: Review",
+                "overview": "Review retrieved material.",
+                "key_concepts": [
+                    {"concept": "concept", "definition": "definition", "source": s}
+                    for s in sources[:3]
+                ],
+                "study_activities": ["read", "practice"],
+                "review_checklist": ["summarize"],
+            }
+            for day in range(1, num_days + 1)
+        ],
+        "sources": sources,
+    }
+
+
+def create_openai_app(faults: FaultConfig, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    _add_fault_injection(app, faults, seed)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        total_tokens = 0
+        for i, text in enumerate(inputs):
+            vector = embed_text(text)
+            total_tokens += len(_tokens(text))
+            embedding = (
+                base64.b64encode(vector.astype("<f4").tobytes()).decode()
+                if as_base64
+                else vector.tolist()
+            )
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": total_tokens, "total_tokens": total_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(str(m.get("content", "")) for m in body["messages"])
+        if "study planning assistant" in prompt:
+            content = json.dumps(_fake_plan(prompt))
+        else:
+            content = json.dumps(_fake_study_plan(prompt))
+        prompt_tokens = len(_tokens(prompt))
+        completion_tokens = len(_tokens(content))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+# ----------------------------------------------------------------------------
+# Pinecone (data plane)
+# ----------------------------------------------------------------------------
+
+def _matches_filter(metadata: Dict[str, Any], query_filter: Optional[Dict[str, Any]]) -> bool:
+    for field, condition in (query_filter or {}).items():
+        expected = condition.get("$eq") if isinstance(condition, dict) else condition
+        if metadata.get(field) != expected:
+            return False
+    return True
+
+
+def create_pinecone_app(faults: FaultConfig, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    _add_fault_injection(app, faults, seed)
+    records: Dict[str, Dict[str, Any]] = {}
+    lock = threading.Lock()
+
+    @app.post("/vectors/upsert")
+    async def upsert(request: Request):
+        body = await request.json()
+        with lock:
+            for vector in body["vectors"]:
+                records[vector["id"]] = {
+                    "values": np.asarray(vector["values"], dtype=np.float32),
+                    "sparse": vector.get("sparseValues") or vector.get("sparse_values"),
+                    "metadata": vector.get("metadata") or {},
+                }
+        return {"upsertedCount": len(body["vectors"])}
+
+    @app.post("/query")
+    async def query(request: Request):
+        body = await request.json()
+        with lock:
+            candidates = [
+                (vector_id, record)
+                for vector_id, record in records.items()
+                if _matches_filter(record["metadata"], body.get("filter"))
+            ]
+        matches = []
+        if candidates:
+            dense = np.asarray(body["vector"], dtype=np.float32)
+            scores = np.stack([r["values"] for _, r in candidates]) @ dense
+            sparse_query = body.get("sparseVector") or body.get("sparse_vector")
+            if sparse_query:
+                query_weights = dict(zip(sparse_query["indices"], sparse_query["values"]))
+                for i, (_, record) in enumerate(candidates):
+                    sparse = record["sparse"] or {"indices": [], "values": []}
+                    scores[i] += sum(
+                        query_weights.get(idx, 0.0) * value
+                        for idx, value in zip(sparse["indices"], sparse["values"])
+                    )
+            top_k = int(body.get("topK", 10))
+            for i in np.argsort(-scores)[:top_k]:
+                vector_id, record = candidates[i]
+                matches.append({
+                    "id": vector_id,
+                    "score": float(scores[i]),
+                    "values": [],
+                    "metadata": record["metadata"] if body.get("includeMetadata") else None,
+                })
+        return {"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 1}}
+
+    @app.post("/vectors/delete")
+    async def delete(request: Request):
+        body = await request.json()
+        with lock:
+            for vector_id in body.get("ids", []):
+                records.pop(vector_id, None)
+        return {}
+
+    return app
+
+
+# ----------------------------------------------------------------------------
+# Cohere
+# ----------------------------------------------------------------------------
+
+def create_cohere_app(faults: FaultConfig, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    _add_fault_injection(app, faults, seed)
+
+    @app.post("/v1/rerank")
+    async def rerank(request: Request):
+        body = await request.json()
+        query_terms = set(_tokens(body["query"]))
+        scored = []
+        for i, document in enumerate(body["documents"]):
+            text = document["text"] if isinstance(document, dict) else document
+            terms = set(_tokens(text))
+            overlap = len(query_terms & terms) / (len(query_terms) or 1)
+            scored.append((overlap, i))
+        scored.sort(reverse=True)
+        top_n = body.get("top_n") or len(scored)
+        return {
+            "id": uuid.uuid4().hex,
+            "results": [{"index": i, "relevance_score": score} for score, i in scored[:top_n]],
+            "meta": {"api_version": {"version": "1"}},
+        }
+
+    return app
+
+
+# ----------------------------------------------------------------------------
+# Static files (stands in for Convex file storage URLs)
+# ----------------------------------------------------------------------------
+
+def create_file_app(root: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/files/{name}")
+    async def get_file(name: str):
+        return FileResponse(root / Path(name).name, media_type="application/pdf")
+
+    return app
+
+
+# ----------------------------------------------------------------------------
+# Server harness
+# ----------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeServer:
+    """Runs an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app: FastAPI):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Fake server on port {self.port} did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
@@ -0,0 +1,330 @@
+"""
+Offline benchmark and load test for the Modal service.
+
+Runs the pipeline functions from app.py in-process (Modal's `.local()`)
+against local stand-ins for OpenAI, Pinecone and Cohere, using a generated
+PDF corpus. No API keys are needed. The only network access is two one-time
+downloads: NLTK data for pinecone-text's BM25, and tiktoken's cl100k_base
+encoding used for chunking. tiktoken caches the encoding in TIKTOKEN_CACHE_DIR
+(default: a tiktoken directory under the system temp dir); point it at a
+directory that already holds the encoding to run fully offline.
+
+    cd modal_service
+    python -m benchmarks.run --files 8 --pages 40 --concurrency 4
+    python -m benchmarks.run --baseline benchmarks/results/<previous>.json
+
+Results are written as JSON (default: benchmarks/results/) so runs can be
+compared across commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.corpus import generate_corpus, generate_queries
+from benchmarks.fakes import (
+    FakeServer,
+    FaultConfig,
+    create_cohere_app,
+    create_file_app,
+    create_openai_app,
+    create_pinecone_app,
+)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+COURSE_ID = "bench-course"
+USER_ID = "bench-user"
+
+# (section, metric) pairs reported when comparing against a baseline
+KEY_METRICS = [
+    ("ingestion", "pages_per_sec"),
+    ("ingestion", "chunks_per_sec"),
+    ("ingestion", "vectors_per_sec"),
+    ("search", "p50"),
+    ("search", "p95"),
+    ("search", "p99"),
+    ("rerank", "p50"),
+    ("rerank", "p95"),
+    ("rerank", "p99"),
+    ("study_plan", "p50"),
+    ("study_plan", "p95"),
+    ("study_plan", "p99"),
+]
+
+Outcome = Tuple[float, Any, Optional[str]]  # (seconds, result, error)
+
+
+def _timed(fn: Callable[[], Any]) -> Outcome:
+    start = time.perf_counter()
+    try:
+        result = fn()
+        return time.perf_counter() - start, result, None
+    except Exception as e:
+        return time.perf_counter() - start, None, f"{type(e).__name__}: {e}"
+
+
+def _run_concurrently(tasks: List[Callable[[], Any]], concurrency: int) -> Tuple[List[Any], float]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda task: task(), tasks))
+    return results, time.perf_counter() - start
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(outcomes: List[Outcome]) -> Dict[str, Any]:
+    """Latency percentiles (ms) over successful calls, plus error counts."""
+    latencies = sorted(seconds * 1000 for seconds, _, error in outcomes if error is None)
+    errors = [error for _, _, error in outcomes if error is not None]
+    return {
+        "count": len(outcomes),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_fakes(args: argparse.Namespace, corpus_dir: Path) -> Dict[str, FakeServer]:
+    def faults(latency_ms: float) -> FaultConfig:
+        return FaultConfig(
+            latency_ms=latency_ms,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+        )
+
+    return {
+        "openai": FakeServer(create_openai_app(faults(args.openai_latency_ms), args.seed)).start(),
+        "pinecone": FakeServer(create_pinecone_app(faults(args.pinecone_latency_ms), args.seed)).start(),
+        "cohere": FakeServer(create_cohere_app(faults(args.cohere_latency_ms), args.seed)).start(),
+        "files": FakeServer(create_file_app(corpus_dir)).start(),
+    }
+
+
+def _point_clients_at_fakes(servers: Dict[str, FakeServer], bm25_params_path: Path) -> None:
+    # The clients are lru_cached in app.py (_openai_client, _chat_llm, _cohere_client,
+    # _pinecone_index, _bm25_query_encoder) and read these variables when first
+    # created, so this must run before any of them is built, e.g. by app._preload()
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": servers["openai"].url + "/v1",
+        "PINECONE_API_KEY": "benchmark",
+        "PINECONE_INDEX_HOST": servers["pinecone"].url,
+        "COHERE_API_KEY": "benchmark",
+        "CO_API_URL": servers["cohere"].url,
+        "BM25_PARAMS_PATH": str(bm25_params_path),
+    })
+
+
+def run_ingestion(app: Any, files: List[Dict[str, Any]], file_base_url: str, concurrency: int) -> Dict[str, Any]:
+    def ingest(record: Dict[str, Any]) -> Tuple[Outcome, Outcome]:
+        processed = _timed(lambda: app.process_pdf_and_generate_embeddings.local(
+            file_url=f"{file_base_url}/files/{record['name']}",
+            file_id=record["name"],
+            course_id=COURSE_ID,
+            user_id=USER_ID,
+            file_name=record["name"],
+        ))
+        if processed[2] is not None:
+            return processed, (0.0, None, "skipped: processing failed")
+        upserted = _timed(lambda: app.upsert_to_pinecone.local(vectors=processed[1]["vectors"]))
+        return processed, upserted
+
+    results, wall = _run_concurrently([lambda r=r: ingest(r) for r in files], concurrency)
+    processed = [p for p, _ in results]
+    upserted = [u for _, u in results]
+    pages = sum(record["pages"] for record, (_, _, error) in zip(files, processed) if error is None)
+    chunks = sum(result["num_chunks"] for _, result, error in processed if error is None)
+    vectors = sum(result["vectors_upserted"] for _, result, error in upserted if error is None)
+    return {
+        "wall_seconds": wall,
+        "files": len(files),
+        "pages": pages,
+        "chunks": chunks,
+        "vectors": vectors,
+        "pages_per_sec": pages / wall,
+        "chunks_per_sec": chunks / wall,
+        "vectors_per_sec": vectors / wall,
+        "process_latency": summarize(processed),
+        "upsert_latency": summarize(upserted),
+    }
+
+
+def ingestion_problems(ingestion: Dict[str, Any], errors_injected: bool) -> List[str]:
+    """
+    Reasons the later phases would measure a broken index. Failures are
+    expected when errors are injected, but an empty index never is.
+    """
+    problems = []
+    if ingestion["vectors"] == 0:
+        problems.append("no vectors were indexed")
+    if not errors_injected:
+        for phase, summary in (("processing", ingestion["process_latency"]), ("upsert", ingestion["upsert_latency"])):
+            if summary["errors"]:
+                problems.append(f"{summary['errors']} {phase} calls failed; first: {summary['first_error']}")
+    return problems
+
+
+def run_search(app: Any, queries: List[str], concurrency: int, top_k: int, top_n: int) -> Dict[str, Any]:
+    def search(query: str) -> Tuple[Outcome, Outcome, Outcome]:
+        start = time.perf_counter()
+        searched = _timed(lambda: app.hybrid_search.local(
+            query=query, course_id=COURSE_ID, user_id=USER_ID, top_k=top_k,
+        ))
+        if searched[2] is not None:
+            return searched, (0.0, None, "skipped: search failed"), searched
+        reranked = _timed(lambda: app.rerank_results.local(
+            query=query, candidates=searched[1], top_n=top_n,
+        ))
+        return searched, reranked, (time.perf_counter() - start, None, reranked[2])
+
+    results, wall = _run_concurrently([lambda q=q: search(q) for q in queries], concurrency)
+    return {
+        "wall_seconds": wall,
+        "queries_per_sec": len(queries) / wall,
+        "search": summarize([s for s, _, _ in results]),
+        "rerank": summarize([r for _, r, _ in results]),
+        "search_and_rerank": summarize([e for _, _, e in results]),
+    }
+
+
+def run_study_plans(app: Any, queries: List[str], num_days: int, concurrency: int) -> Dict[str, Any]:
+    def plan(query: str) -> Outcome:
+        request = app.StudyPlanRequest(
+            query=query, course_id=COURSE_ID, user_id=USER_ID, num_days=num_days,
+        )
+        return _timed(lambda: app.generate_study_plan.local(request))
+
+    results, wall = _run_concurrently([lambda q=q: plan(q) for q in queries], concurrency)
+    return {"wall_seconds": wall, **summarize(results)}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """Table of key metrics; throughputs are better higher, latencies lower."""
+    rows = [f"{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for section, metric in KEY_METRICS:
+        old = baseline.get(section, {}).get(metric)
+        new = current.get(section, {}).get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append(f"{section + '.' + metric:<28}{old:>12.2f}{new:>12.2f}{change:>+9.1f}%")
+    return "\n".join(rows)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8, help="PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=30, help="pages per PDF")
+    parser.add_argument("--queries", type=int, default=100, help="search + rerank requests")
+    parser.add_argument("--study-plans", type=int, default=10, help="study plan requests")
+    parser.add_argument("--num-days", type=int, default=3, help="days per study plan")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent requests per phase")
+    parser.add_argument("--openai-latency-ms", type=float, default=40.0)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=15.0)
+    parser.add_argument("--cohere-latency-ms", type=float, default=60.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", type=Path, help="previous results file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = Path(tmp) / "corpus"
+        files = generate_corpus(corpus_dir, args.files, args.pages, seed=args.seed)
+        queries = generate_queries(args.queries, seed=args.seed)
+
+        servers = _start_fakes(args, corpus_dir)
+        try:
+            # Query-side BM25 fitted on the generated corpus, as it would be in production
+            from pinecone_text.sparse import BM25Encoder
+
+            bm25_params_path = Path(tmp) / "bm25_params.json"
+            BM25Encoder().fit([record["text"] for record in files]).dump(str(bm25_params_path))
+            _point_clients_at_fakes(servers, bm25_params_path)
+
+            import app
+
+            print(f"Ingesting {args.files} files x {args.pages} pages ...", file=sys.stderr)
+            ingestion = run_ingestion(app, files, servers["files"].url, args.concurrency)
+            problems = ingestion_problems(ingestion, errors_injected=args.error_rate > 0)
+            if problems:
+                for problem in problems:
+                    print(f"Ingestion failed: {problem}", file=sys.stderr)
+                raise SystemExit(1)
+            print(f"Running {args.queries} search + rerank requests ...", file=sys.stderr)
+            search = run_search(app, queries, args.concurrency, args.top_k, args.top_n)
+            print(f"Generating {args.study_plans} study plans ...", file=sys.stderr)
+            study_plan = run_study_plans(app, queries[: args.study_plans], args.num_days, args.concurrency)
+        finally:
+            for server in servers.values():
+                server.stop()
+
+    commit = _git_commit()
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "ingestion": ingestion,
+        "search": search["search"],
+        "rerank": search["rerank"],
+        "search_and_rerank": {**search["search_and_rerank"], "queries_per_sec": search["queries_per_sec"]},
+        "study_plan": study_plan,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = RESULTS_DIR / f"{stamp}-{(commit or 'nogit')[:8]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    print(json.dumps({k: results[k] for k in ("ingestion", "search", "rerank", "study_plan")}, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    if args.baseline:
+        print(compare(json.loads(args.baseline.read_text()), results))
+    return results
+
+
+if __name__ == "__main__":
+    main()
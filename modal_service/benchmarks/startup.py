@@ -0,0 +1,215 @@
+"""
+Cold-start benchmark: import time and first-request latency.
+
+    cd modal_service
+    python -m benchmarks.startup --trials 5
+
+Each trial runs in a fresh Python process against the local fakes. It
+times the heavy library imports and `import app`, then the first and
+second search + rerank and study-plan requests. Trials run in two modes:
+"lazy" builds per-container state on the first request, and "preload"
+calls app._preload() first, as Modal containers do at import time (and
+capture in memory snapshots).
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# The --child path must import nothing beyond the standard library before it
+# starts timing, so the benchmark helpers (which pull in numpy, fastapi,
+# uvicorn and pydantic) are only imported by the parent, inside main().
+
+# Imported one by one before app so each library's own cost is visible;
+# shared dependencies are charged to whichever imports them first
+HEAVY_MODULES = [
+    "numpy",
+    "openai",
+    "cohere",
+    "pinecone",
+    "pinecone_text.sparse",
+    "tiktoken",
+    "pypdf",
+    "langchain_openai",
+    "langgraph.graph",
+]
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def child(mode: str, query: str) -> Dict[str, Any]:
+    """Runs inside a fresh interpreter; measurements in milliseconds."""
+    preloaded = [module for module in HEAVY_MODULES if module in sys.modules]
+    if preloaded:
+        raise RuntimeError(f"already imported before timing: {', '.join(preloaded)}")
+    imports = {}
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        imports[module] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    import app
+    imports["app"] = _elapsed_ms(start)
+
+    preload_ms = 0.0
+    if mode == "preload":
+        start = time.perf_counter()
+        app._preload()
+        preload_ms = _elapsed_ms(start)
+
+    from benchmarks.run import COURSE_ID, USER_ID
+
+    def search() -> float:
+        start = time.perf_counter()
+        candidates = app.hybrid_search.local(query=query, course_id=COURSE_ID, user_id=USER_ID)
+        app.rerank_results.local(query=query, candidates=candidates)
+        return _elapsed_ms(start)
+
+    def study_plan() -> float:
+        start = time.perf_counter()
+        app.generate_study_plan.local(app.StudyPlanRequest(
+            query=query, course_id=COURSE_ID, user_id=USER_ID, num_days=2,
+        ))
+        return _elapsed_ms(start)
+
+    first_search = search()
+    second_search = search()
+    first_study_plan = study_plan()
+    second_study_plan = study_plan()
+    return {
+        "imports_ms": imports,
+        "import_total_ms": sum(imports.values()),
+        "preload_ms": preload_ms,
+        "first_search_ms": first_search,
+        "second_search_ms": second_search,
+        "first_study_plan_ms": first_study_plan,
+        "second_study_plan_ms": second_study_plan,
+    }
+
+
+def _median(trials: List[Dict[str, Any]], key: str) -> float:
+    return statistics.median(trial[key] for trial in trials)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--modes", nargs="+", default=["lazy", "preload"], choices=["lazy", "preload"])
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/startup-<time>-<commit>.json)")
+    parser.add_argument("--child", choices=["lazy", "preload"], help=argparse.SUPPRESS)
+    parser.add_argument("--query", default="what is virtual memory", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(child(args.child, args.query)))
+        return None
+
+    from benchmarks.corpus import generate_corpus, generate_queries
+    from benchmarks.fakes import (
+        FakeServer,
+        FaultConfig,
+        create_cohere_app,
+        create_file_app,
+        create_openai_app,
+        create_pinecone_app,
+    )
+    from benchmarks.run import COURSE_ID, RESULTS_DIR, USER_ID, _git_commit, _point_clients_at_fakes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = generate_corpus(Path(tmp) / "corpus", 2, 5)
+        servers = {
+            "openai": FakeServer(create_openai_app(FaultConfig())).start(),
+            "pinecone": FakeServer(create_pinecone_app(FaultConfig())).start(),
+            "cohere": FakeServer(create_cohere_app(FaultConfig())).start(),
+            "files": FakeServer(create_file_app(Path(tmp) / "corpus")).start(),
+        }
+        try:
+            from pinecone_text.sparse import BM25Encoder
+
+            bm25_params_path = Path(tmp) / "bm25_params.json"
+            BM25Encoder().fit([record["text"] for record in files]).dump(str(bm25_params_path))
+            _point_clients_at_fakes(servers, bm25_params_path)
+
+            # Index the corpus once so child searches return real candidates
+            import app
+
+            for record in files:
+                processed = app.process_pdf_and_generate_embeddings.local(
+                    file_url=f"{servers['files'].url}/files/{record['name']}",
+                    file_id=record["name"],
+                    course_id=COURSE_ID,
+                    user_id=USER_ID,
+                    file_name=record["name"],
+                )
+                app.upsert_to_pinecone.local(vectors=processed["vectors"])
+
+            query = generate_queries(1)[0]
+            modes: Dict[str, Any] = {}
+            for mode in args.modes:
+                trials = []
+                for trial in range(args.trials):
+                    completed = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.startup", "--child", mode, "--query", query],
+                        capture_output=True, text=True, check=True,
+                        cwd=Path(__file__).parent.parent, env=os.environ.copy(),
+                    )
+                    trials.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+                    print(f"{mode} trial {trial + 1}/{args.trials} done", file=sys.stderr)
+                modes[mode] = {
+                    "import_total_ms": _median(trials, "import_total_ms"),
+                    "preload_ms": _median(trials, "preload_ms"),
+                    "first_search_ms": _median(trials, "first_search_ms"),
+                    "second_search_ms": _median(trials, "second_search_ms"),
+                    "first_study_plan_ms": _median(trials, "first_study_plan_ms"),
+                    "second_study_plan_ms": _median(trials, "second_study_plan_ms"),
+                    "imports_ms": {
+                        module: statistics.median(t["imports_ms"][module] for t in trials)
+                        for module in trials[0]["imports_ms"]
+                    },
+                    "trials": trials,
+                }
+        finally:
+            for server in servers.values():
+                server.stop()
+
+    commit = _git_commit()
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {"trials": args.trials, "modes": args.modes},
+        "modes": modes,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = RESULTS_DIR / f"startup-{stamp}-{(commit or 'nogit')[:8]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    summary = {mode: {k: v for k, v in data.items() if k != "trials"} for mode, data in modes.items()}
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    main()
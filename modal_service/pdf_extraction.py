@@ -0,0 +1,129 @@
+"""
+Parallel PDF text extraction.
+
+pypdf is pure Python, so extracting a large textbook is CPU-bound on one
+core. Pages are split into contiguous ranges that worker processes extract
+independently; results are merged back in page order. Kept free of Modal
+and app imports so spawned workers start quickly.
+"""
+
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+# Below this many pages per worker, process start-up outweighs the speedup
+MIN_PAGES_PER_WORKER = 16
+# Ranges per worker; smaller ranges even out pages of very different density
+SHARDS_PER_WORKER = 4
+
+PageText = Tuple[int, str]  # (1-based page number, extracted text)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[PageText]:
+    """Extract pages [start, end) (0-based) as (page number, text) pairs."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(pdf_bytes))
+    end = min(end, len(reader.pages))
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def page_ranges(num_pages: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Split [0, num_pages) into at most `num_shards` contiguous, near-equal ranges."""
+    num_shards = max(1, min(num_shards, num_pages))
+    size = math.ceil(num_pages / num_shards) if num_pages else 0
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size or 1)]
+
+
+def effective_workers(num_pages: int, max_workers: Optional[int] = None) -> int:
+    """
+    Processes `extract_pages` actually uses for `num_pages` pages: at most
+    `max_workers` (default: one per CPU), with at least MIN_PAGES_PER_WORKER
+    pages each. 1 means serial extraction in the calling process.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    return max(1, min(max_workers, num_pages // MIN_PAGES_PER_WORKER))
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool reused across calls in a warm container."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # spawn, not fork: the parent holds client threads and sockets
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_workers = workers
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_workers = 0
+
+
+def _extract_file_range(path: str, start: int, end: int) -> List[PageText]:
+    with open(path, "rb") as f:
+        return extract_page_range(f.read(), start, end)
+
+
+def _extract_with_pool(path: str, start: int, num_pages: int, workers: int, max_workers: int) -> List[PageText]:
+    pool = _get_pool(max_workers)
+    futures = [
+        pool.submit(_extract_file_range, path, start + shard_start, start + shard_end)
+        for shard_start, shard_end in page_ranges(num_pages, workers * SHARDS_PER_WORKER)
+    ]
+    pages: List[PageText] = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def extract_pages(
+    pdf_bytes: bytes,
+    start: int = 0,
+    end: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> List[PageText]:
+    """
+    Extract pages [start, end) using up to `max_workers` processes
+    (default: one per CPU). Returns (page number, text) pairs in page order.
+    """
+    if end is None:
+        end = count_pages(pdf_bytes)
+    num_pages = max(0, end - start)
+    max_workers = max_workers or os.cpu_count() or 1
+    workers = effective_workers(num_pages, max_workers)
+    if workers <= 1:
+        return extract_page_range(pdf_bytes, start, end)
+
+    # Workers read the PDF from disk rather than each receiving a pickled copy
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(pdf_bytes)
+        tmp.flush()
+        for attempt in range(2):
+            try:
+                return _extract_with_pool(tmp.name, start, num_pages, workers, max_workers)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a large scan). Drop the cached pool
+                # so this warm container recovers, and retry once.
+                _reset_pool()
+                if attempt:
+                    raise
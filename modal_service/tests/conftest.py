@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# app.py and its helper modules sit next to this directory, as they do in the Modal image
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+# Installed in the Modal image only; `modal deploy` must work without them
+IMAGE_ONLY_PACKAGES = [
+    "cohere",
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langgraph",
+    "numpy",
+    "openai",
+    "pinecone",
+    "pinecone_text",
+    "pypdf",
+    "requests",
+    "tiktoken",
+]
+
+
+def import_app(env=None, blocked=()):
+    """Import app.py in a fresh interpreter, optionally with some packages made unimportable."""
+    script = textwrap.dedent(f"""
+        import importlib.abc
+        import sys
+
+        BLOCKED = {sorted(blocked)!r}
+
+        class Blocker(importlib.abc.MetaPathFinder):
+            def find_spec(self, name, path, target=None):
+                if name.split(".")[0] in BLOCKED:
+                    raise ImportError(f"{{name}} is blocked")
+                return None
+
+        sys.meta_path.insert(0, Blocker())
+        import app
+    """)
+    return subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=SERVICE_DIR,
+        env={**os.environ, "STUDYLENS_PRELOAD": "", **(env or {})},
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_app_imports_without_image_only_packages():
+    result = import_app(blocked=IMAGE_ONLY_PACKAGES)
+    assert result.returncode == 0, result.stderr
+
+
+def test_warm_pool_larger_than_one_does_not_break_single_web_container():
+    result = import_app(env={"STUDYLENS_MIN_CONTAINERS": "2", "STUDYLENS_SCALEDOWN_WINDOW": "600"})
+    assert result.returncode == 0, result.stderr
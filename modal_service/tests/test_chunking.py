@@ -0,0 +1,48 @@
+from app import _chunk_pages_intelligently, _tiktoken_encoding
+
+
+def paragraph(label):
+    return " ".join([label] * 20)
+
+
+def tokens(text):
+    return len(_tiktoken_encoding().encode(text))
+
+
+# Two paragraphs (plus a short overlap tail) fit in a chunk, three never do
+PARAGRAPHS = ["one", "two", "dos", "three", "four"]
+CHUNK_SIZE = 2 * max(tokens(paragraph(label)) for label in PARAGRAPHS) + 10
+
+
+def chunk(pages):
+    return _chunk_pages_intelligently(pages, chunk_size=CHUNK_SIZE, overlap=10)
+
+
+def test_chunk_spanning_pages_records_the_page_it_starts_on():
+    pages = [
+        (1, paragraph("one")),
+        (2, paragraph("two") + "\n\n" + paragraph("dos")),
+        (3, paragraph("three")),
+    ]
+
+    chunks = chunk(pages)
+
+    assert [c["page"] for c in chunks] == [1, 2]
+    assert chunks[0]["text"] == paragraph("one") + "\n\n" + paragraph("two")
+    assert paragraph("three") in chunks[1]["text"]
+
+
+def test_overlap_from_previous_page_does_not_change_starting_page():
+    pages = [(1, paragraph("one") + "\n\n" + paragraph("two")), (4, paragraph("four"))]
+
+    chunks = chunk(pages)
+
+    assert [c["page"] for c in chunks] == [1, 4]
+    # The tail of page 1 is carried over, but the chunk's new content is page 4's
+    assert chunks[1]["text"].startswith(paragraph("two")[-10:].strip())
+    assert chunks[1]["text"].endswith(paragraph("four"))
+    assert paragraph("two") not in chunks[1]["text"]
+
+
+def test_no_pages_means_no_chunks():
+    assert _chunk_pages_intelligently([]) == []
@@ -0,0 +1,56 @@
+import os
+import signal
+
+import pytest
+
+import pdf_extraction
+from benchmarks.corpus import write_pdf
+from pdf_extraction import (
+    MIN_PAGES_PER_WORKER,
+    effective_workers,
+    extract_page_range,
+    extract_pages,
+    page_ranges,
+)
+
+
+@pytest.fixture(scope="module")
+def pdf_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pdf") / "doc.pdf"
+    write_pdf(path, [[f"page {i} text"] for i in range(2 * MIN_PAGES_PER_WORKER)])
+    return path.read_bytes()
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    yield
+    pdf_extraction._reset_pool()
+
+
+def test_page_ranges_cover_all_pages_in_order():
+    assert page_ranges(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert page_ranges(2, 8) == [(0, 1), (1, 2)]
+    assert page_ranges(0, 4) == []
+
+
+def test_effective_workers_needs_enough_pages_per_worker():
+    assert effective_workers(40, 8) == 40 // MIN_PAGES_PER_WORKER
+    assert effective_workers(10 * MIN_PAGES_PER_WORKER, 4) == 4
+    assert effective_workers(MIN_PAGES_PER_WORKER - 1, 4) == 1
+    assert effective_workers(0, 4) == 1
+
+
+def test_parallel_extraction_matches_serial(pdf_bytes):
+    expected = extract_page_range(pdf_bytes, 0, 2 * MIN_PAGES_PER_WORKER)
+    assert extract_pages(pdf_bytes, max_workers=2) == expected
+    assert extract_pages(pdf_bytes, start=5, end=9, max_workers=2) == expected[5:9]
+
+
+def test_recovers_from_a_crashed_worker(pdf_bytes):
+    expected = extract_pages(pdf_bytes, max_workers=2)
+    pool = pdf_extraction._pool
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    assert extract_pages(pdf_bytes, max_workers=2) == expected
+    assert pdf_extraction._pool is not pool
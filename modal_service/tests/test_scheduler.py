@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from app import Priority, RequestTooLarge, SchedulerSaturated, TokenBucket, UpstreamScheduler
+
+
+def make_scheduler(rate=10.0, capacity=1.0, max_queue=10, max_wait=5.0, batch_reserve=0.0):
+    return UpstreamScheduler(
+        buckets={"openai": TokenBucket(rate=rate, capacity=capacity)},
+        max_queue={Priority.INTERACTIVE: max_queue, Priority.BATCH: max_queue},
+        max_wait=max_wait if isinstance(max_wait, dict) else {
+            Priority.INTERACTIVE: max_wait,
+            Priority.BATCH: max_wait,
+        },
+        batch_reserve=batch_reserve,
+    )
+
+
+def drain(scheduler, provider="openai"):
+    bucket = scheduler.buckets[provider]
+    bucket.consume(bucket.tokens)
+
+
+def test_interactive_served_before_earlier_batch_then_fifo():
+    async def run():
+        scheduler = make_scheduler(rate=20.0)
+        drain(scheduler)
+        granted = []
+
+        async def request(name, priority):
+            await scheduler.acquire({"openai": 1}, priority)
+            granted.append(name)
+
+        tasks = []
+        for name, priority in [
+            ("batch-1", Priority.BATCH),
+            ("batch-2", Priority.BATCH),
+            ("interactive", Priority.INTERACTIVE),
+        ]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return granted
+
+    assert asyncio.run(run()) == ["interactive", "batch-1", "batch-2"]
+
+
+def test_batch_cannot_drain_reserve():
+    async def run():
+        # Effectively no refill during the test
+        scheduler = make_scheduler(rate=0.001, capacity=10.0, max_wait=1.0, batch_reserve=0.3)
+        await scheduler.acquire({"openai": 7}, Priority.BATCH)
+        with pytest.raises(SchedulerSaturated):
+            await scheduler.acquire({"openai": 1}, Priority.BATCH)
+        # The reserved headroom is still there for interactive traffic
+        await scheduler.acquire({"openai": 3}, Priority.INTERACTIVE)
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejected_and_cancelled_waiter_removed():
+    async def run():
+        scheduler = make_scheduler(rate=1.0, max_queue=1)
+        drain(scheduler)
+        waiter = asyncio.create_task(scheduler.acquire({"openai": 1}, Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth(Priority.INTERACTIVE) == 1
+
+        with pytest.raises(SchedulerSaturated, match="queue is full") as excinfo:
+            await scheduler.acquire({"openai": 1}, Priority.INTERACTIVE)
+        assert excinfo.value.retry_after >= 1.0
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.queue_depth(Priority.INTERACTIVE) == 0
+
+    asyncio.run(run())
+
+
+def test_wait_budget_exceeded_after_interactive_requests_overtake():
+    async def run():
+        scheduler = make_scheduler(
+            rate=10.0,
+            max_wait={Priority.INTERACTIVE: 5.0, Priority.BATCH: 0.15},
+        )
+        drain(scheduler)
+        # Admitted on its 0.1s estimate, then overtaken by two interactive requests
+        batch = asyncio.create_task(scheduler.acquire({"openai": 1}, Priority.BATCH))
+        await asyncio.sleep(0)
+        interactive = [
+            asyncio.create_task(scheduler.acquire({"openai": 1}, Priority.INTERACTIVE))
+            for _ in range(2)
+        ]
+        with pytest.raises(SchedulerSaturated, match="timed out"):
+            await batch
+        assert scheduler.queue_depth(Priority.BATCH) == 0
+        await asyncio.gather(*interactive)
+
+    asyncio.run(run())
+
+
+def test_estimated_wait_over_budget_rejected_up_front():
+    async def run():
+        scheduler = make_scheduler(rate=1.0, capacity=5.0, max_wait=2.0)
+        drain(scheduler)
+        with pytest.raises(SchedulerSaturated, match="quota exhausted") as excinfo:
+            await scheduler.acquire({"openai": 3}, Priority.INTERACTIVE)
+        assert excinfo.value.retry_after == pytest.approx(3.0, abs=0.1)
+        assert scheduler.queue_depth(Priority.INTERACTIVE) == 0
+
+    asyncio.run(run())
+
+
+def test_request_larger_than_bucket_rejected_even_when_idle():
+    async def run():
+        scheduler = make_scheduler(capacity=10.0, batch_reserve=0.3)
+        with pytest.raises(RequestTooLarge):
+            await scheduler.acquire({"openai": 11}, Priority.INTERACTIVE)
+        with pytest.raises(RequestTooLarge):
+            await scheduler.acquire({"openai": 8}, Priority.BATCH)
+        # Nothing was consumed by the rejected requests
+        await scheduler.acquire({"openai": 10}, Priority.INTERACTIVE)
+
+    asyncio.run(run())
+
+
+def test_oversized_study_plan_gets_400_without_retry_after(monkeypatch):
+    monkeypatch.setattr(app, "_scheduler", None)
+    client = TestClient(app.web_app)
+    response = client.post("/generate_study_plan", json={
+        "query": "review everything",
+        "course_id": "course",
+        "user_id": "user",
+        "num_days": 100,
+    })
+    assert response.status_code == 400
+    assert "Retry-After" not in response.headers
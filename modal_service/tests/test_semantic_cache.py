@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from app import SemanticCache
+
+AXES = np.eye(4)
+KEY = ("course-1", "user", 50, 5)
+
+
+def make_cache(threshold=0.9, max_entries=2, max_keys=2):
+    return SemanticCache(threshold=threshold, max_entries=max_entries, max_keys=max_keys)
+
+
+def store(cache, key, embedding, results):
+    cache.store(key, embedding, results, cache.generation(key[0]))
+
+
+def test_lookup_hits_similar_queries_only():
+    cache = make_cache()
+    store(cache, KEY, AXES[0], ["a"])
+
+    # Unnormalized and slightly different embeddings still match
+    assert cache.lookup(KEY, 3 * AXES[0] + 0.1 * AXES[1]) == ["a"]
+    assert cache.lookup(KEY, AXES[0] + AXES[1]) is None  # cosine ~0.71
+    assert cache.lookup(KEY, AXES[1]) is None
+
+
+def test_lookup_is_scoped_to_course_and_search_parameters():
+    cache = make_cache(max_keys=4)
+    store(cache, KEY, AXES[0], ["a"])
+
+    assert cache.lookup(("course-2", "user", 50, 5), AXES[0]) is None
+    assert cache.lookup(("course-1", "user", 50, 10), AXES[0]) is None
+
+
+def test_entries_evicted_least_recently_used():
+    cache = make_cache()
+    store(cache, KEY, AXES[0], ["a"])
+    store(cache, KEY, AXES[1], ["b"])
+    assert cache.lookup(KEY, AXES[0]) == ["a"]  # "b" is now least recently used
+
+    store(cache, KEY, AXES[2], ["c"])
+
+    assert cache.lookup(KEY, AXES[1]) is None
+    assert cache.lookup(KEY, AXES[0]) == ["a"]
+    assert cache.lookup(KEY, AXES[2]) == ["c"]
+
+
+def test_courses_evicted_least_recently_used():
+    cache = make_cache()
+    keys = [(f"course-{i}", "user", 50, 5) for i in range(3)]
+    store(cache, keys[0], AXES[0], ["0"])
+    store(cache, keys[1], AXES[0], ["1"])
+    assert cache.lookup(keys[0], AXES[0]) == ["0"]
+
+    store(cache, keys[2], AXES[0], ["2"])
+
+    assert cache.lookup(keys[1], AXES[0]) is None
+    assert cache.lookup(keys[0], AXES[0]) == ["0"]
+    assert cache.lookup(keys[2], AXES[0]) == ["2"]
+
+
+def test_invalidate_drops_only_that_course():
+    cache = make_cache(max_keys=4)
+    other = ("course-2", "user", 50, 5)
+    store(cache, KEY, AXES[0], ["a"])
+    store(cache, ("course-1", "user", 50, 10), AXES[0], ["a10"])
+    store(cache, other, AXES[0], ["b"])
+
+    cache.invalidate("course-1")
+
+    assert cache.lookup(KEY, AXES[0]) is None
+    assert cache.lookup(("course-1", "user", 50, 10), AXES[0]) is None
+    assert cache.lookup(other, AXES[0]) == ["b"]
+
+
+def test_results_computed_across_an_invalidation_are_not_stored():
+    cache = make_cache()
+    generation = cache.generation("course-1")
+    cache.invalidate("course-1")  # e.g. an upsert finished while the search ran
+
+    cache.store(KEY, AXES[0], ["stale"], generation)
+
+    assert cache.lookup(KEY, AXES[0]) is None
+    store(cache, KEY, AXES[0], ["fresh"])
+    assert cache.lookup(KEY, AXES[0]) == ["fresh"]
+
+
+def test_results_computed_across_a_clear_are_not_stored():
+    cache = make_cache()
+    store(cache, KEY, AXES[1], ["kept until clear"])
+    generation = cache.generation("course-1")
+    cache.clear()
+
+    cache.store(KEY, AXES[0], ["stale"], generation)
+
+    assert cache.lookup(KEY, AXES[0]) is None
+    assert cache.lookup(KEY, AXES[1]) is None
+
+
+@pytest.mark.parametrize("max_entries, max_keys", [(0, 2), (2, 0)])
+def test_zero_size_disables_cache(max_entries, max_keys):
+    cache = make_cache(max_entries=max_entries, max_keys=max_keys)
+    store(cache, KEY, AXES[0], ["a"])
+    assert cache.lookup(KEY, AXES[0]) is None
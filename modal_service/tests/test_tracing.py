@@ -0,0 +1,52 @@
+import asyncio
+
+import app
+from app import Trace, current_trace, traced
+
+
+@traced
+def traced_function(value, trace_id=None):
+    with current_trace().span("work"):
+        pass
+    current_trace().count("vectors", 3, op="retrieved")
+    return value * 2
+
+
+class FakeRemoteFunction:
+    """Stands in for a Modal function handle: `.remote.aio(...)` runs it locally."""
+
+    def __init__(self, func):
+        self.remote = self
+        self._func = func
+
+    async def aio(self, *args, **kwargs):
+        return self._func(*args, **kwargs)
+
+
+def test_traced_returns_plain_result_without_trace_id():
+    assert traced_function(2) == 4
+
+
+def test_traced_returns_trace_with_result_when_asked():
+    response = traced_function(2, trace_id="abc")
+    assert response["result"] == 4
+    assert [span["stage"] for span in response["trace"]["spans"]] == ["work"]
+    assert response["trace"]["counts"] == [
+        {"metric": "vectors", "value": 3, "labels": {"op": "retrieved"}}
+    ]
+
+
+def test_call_remote_merges_remote_trace_into_request_trace():
+    async def run():
+        trace = Trace()
+        token = app._current_trace.set(trace)
+        try:
+            result = await app._call_remote(FakeRemoteFunction(traced_function), 5)
+        finally:
+            app._current_trace.reset(token)
+        return result, trace
+
+    result, trace = asyncio.run(run())
+    assert result == 10
+    assert [span["stage"] for span in trace.spans] == ["work"]
+    assert "work;dur=" in trace.server_timing()